@@ -1,12 +1,49 @@
-from flask import Flask, request, jsonify, session, render_template, redirect, url_for, flash
+from flask import (
+    Flask, Response, abort, request, jsonify, session, render_template, redirect, url_for, flash,
+    make_response, send_file, stream_with_context
+)
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from sqlalchemy import or_, select
-from models import db, User, Group, GroupMember, Settlement, Expense, ExpenseSplit
-from auth import login_required, admin_only
+import shutil
+import time
+import click
+from sqlalchemy import delete, event, func, inspect, or_, select, update
+from models import db, User, Group, GroupMember, Settlement, Expense, Job, Change
+from auth import login_required, admin_only, login_user, current_user, current_role
+from cache import LRUCache
+from group_cache import (
+    init_view_cache, clear_view_cache, bump_group_version, cached_group_view, group_marker,
+    GroupNotFound
+)
+from conditional import conditional_group_get, not_modified, set_validators
+from group_events import init_group_events, queue_group_event, subscribe, event_stream, hub, max_streams
+from change_log import (
+    CursorExpired, head_cursor, record_change, record_group_deleted, record_member_renamed, sync_page,
+)
+from group_deletion import soft_delete_group, purge_group, deleted_group_ids
+from jobs import (
+    JOB_STATUSES, JobFailed, init_jobs, job_type, enqueue, job_json, job_file, start_job_runner
+)
+from money import to_cents, from_cents, format_cents
+from metrics import init_metrics
+from db_routing import REPLICA_BIND, engine_options, init_read_routing
+from migrations import upgrade_schema
+from query_budget import init_repeat_warnings
+from passwords import init_passwords, hash_password, verify_password
+from expenses import record_expense
+from member_sets import compact_group_splits
+from solver import SOLVERS, solve_transfers
+from pagination import InvalidCursor, keyset_page, parse_limit
+from ledger_io import (
+    import_expenses, iter_csv_records, iter_ndjson_records, export_csv, export_ndjson
+)
+from balances import (
+    calculate_balances, rebuild_ledger, apply_balance_deltas,
+    add_ledger_members, ledger_drift, take_balance_snapshot, verify_balance_snapshot,
+    snapshot_due_groups, user_balances
+)
 
 # --------------------------------------------------
 # APP SETUP
@@ -17,15 +54,61 @@ load_dotenv()
 app = Flask(__name__)
 
 # Logic to fix the database URI for production
-uri = os.getenv("DATABASE_URL")
-if uri and uri.startswith("postgres://"):
-    uri = uri.replace("postgres://", "postgresql://", 1)
+def database_uri(name):
+    uri = os.getenv(name)
+    if uri and uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+    return uri
+
+
+uri = database_uri("DATABASE_URL")
+replica_uri = database_uri("DATABASE_REPLICA_URL")
 
 app.config["SQLALCHEMY_DATABASE_URI"] = uri
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(uri)
+if replica_uri:
+    app.config["SQLALCHEMY_BINDS"] = {
+        REPLICA_BIND: {"url": replica_uri, **engine_options(replica_uri)}
+    }
+app.config["REPLICA_READ_YOUR_WRITES_SECONDS"] = float(os.getenv("REPLICA_READ_YOUR_WRITES_SECONDS", "5"))
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+app.config["GROUP_VIEW_CACHE_BACKEND"] = os.getenv("GROUP_VIEW_CACHE_BACKEND")
+app.config["GROUP_VIEW_CACHE_SIZE"] = int(os.getenv("GROUP_VIEW_CACHE_SIZE", "512"))
+app.config["SLOW_REQUEST_MS"] = float(os.getenv("SLOW_REQUEST_MS", "0"))
+app.config["SLOW_REQUEST_QUERIES"] = int(os.getenv("SLOW_REQUEST_QUERIES", "0"))
+app.config["QUERY_REPEAT_WARN"] = int(os.getenv("QUERY_REPEAT_WARN", "0"))
+app.config["ROLE_CACHE_TTL"] = int(os.getenv("ROLE_CACHE_TTL", "60"))
+app.config["PASSWORD_HASH_METHOD"] = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+app.config["PASSWORD_HASH_WORKERS"] = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))
+app.config["JOBS_ENABLED"] = os.getenv("JOBS_ENABLED", "1") not in ("0", "false", "no")
+app.config["JOB_WORKERS"] = int(os.getenv("JOB_WORKERS", "2"))
+app.config["JOB_POLL_SECONDS"] = float(os.getenv("JOB_POLL_SECONDS", "2"))
+app.config["JOB_STALE_SECONDS"] = float(os.getenv("JOB_STALE_SECONDS", "60"))
+app.config["JOB_FILES_DIR"] = os.getenv("JOB_FILES_DIR")
+app.config["BALANCE_SNAPSHOT_INTERVAL"] = float(os.getenv("BALANCE_SNAPSHOT_INTERVAL", "0"))
+app.config["BALANCE_SNAPSHOT_WRITES"] = int(os.getenv("BALANCE_SNAPSHOT_WRITES", "500"))
+app.config["GROUP_EVENTS_FANOUT"] = os.getenv("GROUP_EVENTS_FANOUT", "auto")
+app.config["GROUP_EVENTS_POLL_SECONDS"] = float(os.getenv("GROUP_EVENTS_POLL_SECONDS", "1"))
+app.config["GROUP_EVENTS_KEEPALIVE_SECONDS"] = float(os.getenv("GROUP_EVENTS_KEEPALIVE_SECONDS", "15"))
+# Unset: derived from the gunicorn worker class and threads (group_events.stream_limit)
+app.config["GROUP_EVENTS_MAX_STREAMS"] = (
+    int(os.environ["GROUP_EVENTS_MAX_STREAMS"]) if os.getenv("GROUP_EVENTS_MAX_STREAMS") else None
+)
+app.config["SYNC_SETTLE_SECONDS"] = float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+
+SETTLEMENT_SOLVER = os.getenv("SETTLEMENT_SOLVER", "optimal")
+if SETTLEMENT_SOLVER not in SOLVERS:
+    raise RuntimeError(f"Unknown SETTLEMENT_SOLVER {SETTLEMENT_SOLVER!r}")
 
 db.init_app(app)
+init_view_cache(app)
+init_metrics(app)
+init_repeat_warnings(app)
+init_passwords(app)
+init_read_routing(app)
+init_jobs(app)
+init_group_events(app)
 
 # --------------------------------------------------
 # CONTEXT PROCESSOR
@@ -33,10 +116,7 @@ db.init_app(app)
 
 @app.context_processor
 def inject_current_user():
-    if "user_id" in session:
-        user = db.session.get(User, session["user_id"])
-        return {"current_user": user}
-    return {"current_user": None}
+    return {"current_user": current_user()}
 
 
 # --------------------------------------------------
@@ -44,41 +124,146 @@ def inject_current_user():
 # --------------------------------------------------
 
 def admin_required():
-    if "user_id" not in session:
-        return False
-    user = db.session.get(User, session["user_id"])
-    return user and user.role == "admin"
+    return current_role() == "admin"
+
+
+# Per process: a rename clears it here at once, in other workers after USER_NAME_CACHE_TTL seconds
+_user_names = LRUCache(
+    maxsize=int(os.getenv("USER_NAME_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_NAME_CACHE_TTL", "60")),
+)
+_MISSING = object()
+
+
+def user_names(user_ids):
+    """Map user ids to names, fetching uncached ids with a single IN query."""
+    names = {}
+    missing = []
+
+    for uid in set(user_ids):
+        name = _user_names.get(uid, _MISSING)
+        if name is _MISSING:
+            missing.append(uid)
+        else:
+            names[uid] = name
+
+    if missing:
+        rows = db.session.execute(
+            select(User.id, User.name).where(User.id.in_(missing))
+        ).all()
+        for uid, name in rows:
+            _user_names.set(uid, name)
+            names[uid] = name
+
+    return names
+
+
+@event.listens_for(User, "after_delete")
+def forget_user_name(mapper, connection, target):
+    _user_names.delete(target.id)
+    clear_view_cache()
+    # Names are part of every group response; move the ETags of the user's groups
+    connection.execute(
+        update(Group)
+        .where(Group.id.in_(select(GroupMember.group_id).where(GroupMember.user_id == target.id)))
+        .values(version=Group.version + 1, updated_at=datetime.utcnow())
+    )
+    record_member_renamed(connection, target.id)
 
 
-def calculate_balances(group_id):
-    balances = {}
+@event.listens_for(User, "after_update")
+def forget_renamed_user(mapper, connection, target):
+    # Password rehashes and role changes leave cached names valid
+    if inspect(target).attrs.name.history.has_changes():
+        forget_user_name(mapper, connection, target)
 
-    members = GroupMember.query.filter_by(group_id=group_id).all()
-    for m in members:
-        balances[m.user_id] = 0.0
 
-    expenses = Expense.query.filter_by(group_id=group_id).all()
-    for exp in expenses:
-        balances[exp.paid_by] += exp.amount
+def record_group_created(group_id, member_ids):
+    record_change(group_id, "group", group_id)
+    for uid in member_ids:
+        record_change(group_id, "membership", int(uid))
 
-        splits = ExpenseSplit.query.filter_by(expense_id=exp.id).all()
-        for s in splits:
-            balances[s.user_id] -= s.amount_owed
 
-    settlements = Settlement.query.filter_by(group_id=group_id).all()
-    for s in settlements:
-        balances[s.payer_id] += s.amount
-        balances[s.receiver_id] -= s.amount
+def live_group(group_id):
+    """The group, or None if it does not exist or has been deleted."""
+    return db.session.execute(
+        select(Group).where(Group.id == group_id, Group.deleted_at.is_(None))
+    ).scalar()
+
+
+def groups_with_member_counts(group_filter):
+    """Live groups matching group_filter with their member counts, in one query."""
+    group_ids = select(Group.id).where(group_filter, Group.deleted_at.is_(None))
+
+    counts = (
+        select(GroupMember.group_id, func.count(GroupMember.id).label("member_count"))
+        .where(GroupMember.group_id.in_(group_ids))
+        .group_by(GroupMember.group_id)
+        .subquery()
+    )
+
+    rows = db.session.execute(
+        select(Group.id, Group.name, func.coalesce(counts.c.member_count, 0))
+        .outerjoin(counts, counts.c.group_id == Group.id)
+        .where(Group.id.in_(group_ids))
+        .order_by(Group.id)
+    ).all()
+
+    return [
+        {"id": gid, "name": name, "member_count": count}
+        for gid, name, count in rows
+    ]
+
 
-    return balances
+def paginated_response(result, next_cursor, limit):
+    """JSON list response carrying the keyset cursor of the next page, if any."""
+    response = jsonify(result)
+    if next_cursor:
+        next_url = url_for(request.endpoint, **request.view_args, cursor=next_cursor, limit=limit)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
 
 
 def balance_integrity_ok(balances):
-    return abs(sum(balances.values())) < 0.01
+    return sum(balances.values()) == 0
+
+
+def authenticate(email, password):
+    """The user with these credentials, or None.
+
+    Upgrades the stored hash when PASSWORD_HASH_METHOD has changed.
+    """
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        return None
+
+    ok, new_hash = verify_password(user.password, password)
+    if not ok:
+        return None
+
+    if new_hash:
+        try:
+            user.password = new_hash
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning("Failed to rehash password for user %s: %s", user.id, e)
+
+    return user
+
+
+# The app never demotes admins, so once one is seen the lookup can be skipped
+_admin_exists = False
 
 
 def promote_first_user_to_admin():
     """Promote the first registered user to admin if no admin exists."""
+    global _admin_exists
+    if _admin_exists or session.get("role") == "admin":
+        _admin_exists = True
+        return
+
     try:
         # Check if ANY admin exists
         admin_exists = db.session.execute(
@@ -86,6 +271,7 @@ def promote_first_user_to_admin():
         ).first()
 
         if admin_exists:
+            _admin_exists = True
             return
 
         # Get the first user (oldest by ID)
@@ -97,51 +283,21 @@ def promote_first_user_to_admin():
             user = first_user[0]  # Extract user from result tuple
             user.role = "admin"
             db.session.commit()
+            _admin_exists = True
     except Exception as e:
         db.session.rollback()
         print(f"Error promoting user to admin: {e}")
 
 
-def suggest_settlements(group_id):
+def suggest_settlements(group_id, balances=None):
     """Suggest optimal settlements to minimize transactions."""
-    balances = calculate_balances(group_id)
-
-    creditors = []
-    debtors = []
-
-    for user_id, balance in balances.items():
-        if balance > 0.01:  # Small threshold to avoid floating point issues
-            creditors.append([user_id, balance])
-        elif balance < -0.01:
-            debtors.append([user_id, -balance])
-
-    creditors.sort(key=lambda x: x[1], reverse=True)
-    debtors.sort(key=lambda x: x[1], reverse=True)
-
-    suggestions = []
-
-    i = j = 0
-    while i < len(debtors) and j < len(creditors):
-        debtor_id, debtor_amt = debtors[i]
-        creditor_id, creditor_amt = creditors[j]
-
-        settle_amt = min(debtor_amt, creditor_amt)
-
-        suggestions.append({
-            "from": debtor_id,
-            "to": creditor_id,
-            "amount": round(settle_amt, 2)
-        })
-
-        debtors[i][1] -= settle_amt
-        creditors[j][1] -= settle_amt
-
-        if debtors[i][1] < 0.01:  # Essentially zero
-            i += 1
-        if creditors[j][1] < 0.01:  # Essentially zero
-            j += 1
+    if balances is None:
+        balances = calculate_balances(group_id)
 
-    return suggestions
+    return [
+        {"from": debtor_id, "to": creditor_id, "amount": from_cents(cents)}
+        for debtor_id, creditor_id, cents in solve_transfers(balances, SETTLEMENT_SOLVER)
+    ]
 
 
 # --------------------------------------------------
@@ -157,7 +313,7 @@ def register():
         if User.query.filter_by(email=data["email"]).first():
             return jsonify({"error": "Email already registered"}), 400
         
-        hashed = generate_password_hash(data["password"])
+        hashed = hash_password(data["password"])
 
         user = User(
             name=data["name"],
@@ -178,13 +334,13 @@ def register():
 def login():
     try:
         data = request.json
-        user = User.query.filter_by(email=data["email"]).first()
+        user = authenticate(data["email"], data["password"])
 
-        if not user or not check_password_hash(user.password, data["password"]):
+        if not user:
             return jsonify({"error": "Invalid credentials"}), 401
 
         # Set session for API login as well
-        session["user_id"] = user.id
+        login_user(user)
         
         return jsonify({"id": user.id, "name": user.name, "email": user.email})
     except Exception as e:
@@ -204,6 +360,39 @@ def all_users():
         return jsonify({"error": "Failed to fetch users"}), 500
 
 
+def balance_summary(user_id):
+    """A user's net balance in each of their groups plus totals, in cents."""
+    groups = [
+        {"group_id": gid, "name": name, "net_cents": net}
+        for gid, name, net in user_balances(user_id)
+    ]
+    return {
+        "groups": groups,
+        "owed_to_you_cents": sum(g["net_cents"] for g in groups if g["net_cents"] > 0),
+        "you_owe_cents": -sum(g["net_cents"] for g in groups if g["net_cents"] < 0),
+        "total_cents": sum(g["net_cents"] for g in groups),
+    }
+
+
+@app.route("/api/users/<int:user_id>/summary")
+def user_summary(user_id):
+    try:
+        summary = balance_summary(user_id)
+
+        return jsonify({
+            "user_id": user_id,
+            "groups": [
+                {"group_id": g["group_id"], "name": g["name"], "net": from_cents(g["net_cents"])}
+                for g in summary["groups"]
+            ],
+            "owed_to_you": from_cents(summary["owed_to_you_cents"]),
+            "you_owe": from_cents(summary["you_owe_cents"]),
+            "total": from_cents(summary["total_cents"]),
+        })
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch summary"}), 500
+
+
 # --------------------------------------------------
 # GROUPS
 # --------------------------------------------------
@@ -214,11 +403,13 @@ def create_group():
         data = request.json
         group = Group(name=data["name"], created_by=data["creator_id"])
         db.session.add(group)
-        db.session.commit()
+        db.session.flush()
 
         for uid in data["member_ids"]:
             db.session.add(GroupMember(group_id=group.id, user_id=uid))
 
+        add_ledger_members(group.id, data["member_ids"])
+        record_group_created(group.id, data["member_ids"])
         db.session.commit()
         return jsonify({"group_id": group.id})
     except Exception as e:
@@ -229,25 +420,18 @@ def create_group():
 @app.route("/api/groups/<int:user_id>")
 def user_groups(user_id):
     try:
-        groups = (
-            db.session.query(Group)
-            .join(GroupMember, Group.id == GroupMember.group_id)
-            .filter(GroupMember.user_id == user_id)
-            .all()
+        result = groups_with_member_counts(
+            Group.id.in_(select(GroupMember.group_id).where(GroupMember.user_id == user_id))
         )
 
-        result = []
-        for g in groups:
-            count = GroupMember.query.filter_by(group_id=g.id).count()
-            result.append({"id": g.id, "name": g.name, "member_count": count})
-
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": "Failed to fetch groups"}), 500
 
 
 @app.route("/api/groups/<int:group_id>/members")
-def group_members(group_id):
+@conditional_group_get("members")
+def group_members(group_id, version):
     try:
         members = (
             db.session.query(User)
@@ -269,51 +453,52 @@ def group_members(group_id):
 def add_expense():
     try:
         data = request.json
+        splits = data.get("splits")
+        split_type = data.get("split_type") or ("exact" if isinstance(splits, dict) else "equal")
 
-        expense = Expense(
-            group_id=data["group_id"],
-            amount=data["amount"],
-            description=data.get("description"),
-            paid_by=data["paid_by"]
+        expense_id = record_expense(
+            int(data["group_id"]), int(data["paid_by"]), to_cents(data["amount"]),
+            split_type, splits, data.get("description")
         )
-
-        db.session.add(expense)
-        db.session.commit()
-
-        for uid, amt in data["splits"].items():
-            db.session.add(
-                ExpenseSplit(
-                    expense_id=expense.id,
-                    user_id=int(uid),
-                    amount_owed=amt
-                )
-            )
-
-        db.session.commit()
-        return jsonify({"status": "expense added"})
+        return jsonify({"status": "expense added", "expense_id": expense_id})
+    except GroupNotFound:
+        db.session.rollback()
+        return jsonify({"error": "Group not found"}), 404
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Failed to add expense"}), 500
 
 
 @app.route("/api/expenses/<int:group_id>")
-def list_expenses(group_id):
+@conditional_group_get("expenses")
+def list_expenses(group_id, version):
     try:
-        expenses = Expense.query.filter_by(group_id=group_id).order_by(Expense.created_at.desc()).all()
+        limit = parse_limit(request.args.get("limit"))
+        expenses, next_cursor = keyset_page(
+            Expense.query.filter_by(group_id=group_id),
+            Expense,
+            cursor=request.args.get("cursor"),
+            limit=limit
+        )
+        names = user_names(e.paid_by for e in expenses)
         result = []
 
         for e in expenses:
-            payer = User.query.get(e.paid_by)
-            if payer:
+            if e.paid_by in names:
                 result.append({
                     "id": e.id,
-                    "amount": e.amount,
+                    "amount": from_cents(e.amount_cents),
                     "description": e.description,
-                    "payer_name": payer.name,
+                    "payer_name": names[e.paid_by],
                     "created_at": e.created_at.isoformat()
                 })
 
-        return jsonify(result)
+        return paginated_response(result, next_cursor, limit)
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
     except Exception as e:
         return jsonify({"error": "Failed to fetch expenses"}), 500
 
@@ -322,20 +507,31 @@ def list_expenses(group_id):
 # BALANCES
 # --------------------------------------------------
 
+def build_balance_rows(group_id):
+    """Named balance rows for a group, or None if the balances do not net to zero."""
+    balances = calculate_balances(group_id)
+
+    if not balance_integrity_ok(balances):
+        return None
+
+    names = user_names(balances)
+    result = []
+    for uid, bal in balances.items():
+        if uid in names:
+            result.append({"user_id": uid, "name": names[uid], "balance": from_cents(bal)})
+
+    return result
+
+
 @app.route("/api/balances/<int:group_id>")
-def balances(group_id):
+@conditional_group_get("balances")
+def balances(group_id, version):
     try:
-        balances = calculate_balances(group_id)
+        result = cached_group_view(group_id, version, "balances", build_balance_rows)
 
-        if not balance_integrity_ok(balances):
+        if result is None:
             return jsonify({"error": "Balance integrity violated"}), 500
 
-        result = []
-        for uid, bal in balances.items():
-            user = User.query.get(uid)
-            if user:
-                result.append({"user_id": uid, "name": user.name, "balance": round(bal, 2)})
-
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": "Failed to calculate balances"}), 500
@@ -350,44 +546,345 @@ def add_settlement():
     try:
         data = request.json
 
+        bump_group_version(data["group_id"])
+
         settlement = Settlement(
             group_id=data["group_id"],
             payer_id=data["payer_id"],
             receiver_id=data["receiver_id"],
-            amount=data["amount"]
+            amount_cents=to_cents(data["amount"])
         )
 
         db.session.add(settlement)
+        apply_balance_deltas(settlement.group_id, [
+            (settlement.payer_id, settlement.amount_cents),
+            (settlement.receiver_id, -settlement.amount_cents)
+        ])
+        queue_settlement_event(settlement)
         db.session.commit()
         return jsonify({"status": "settlement recorded"})
+    except GroupNotFound:
+        db.session.rollback()
+        return jsonify({"error": "Group not found"}), 404
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Failed to record settlement"}), 500
 
 
+def queue_settlement_event(settlement):
+    db.session.flush()  # assigns the id
+    queue_group_event(settlement.group_id, "settlement", id=settlement.id,
+                      amount=from_cents(settlement.amount_cents),
+                      payer_id=settlement.payer_id, receiver_id=settlement.receiver_id)
+    record_change(settlement.group_id, "settlement", settlement.id)
+
+
 @app.route("/api/settlements/<int:group_id>")
-def list_settlements(group_id):
+@conditional_group_get("settlements")
+def list_settlements(group_id, version):
     try:
-        settlements = Settlement.query.filter_by(group_id=group_id).order_by(Settlement.created_at.desc()).all()
+        limit = parse_limit(request.args.get("limit"))
+        settlements, next_cursor = keyset_page(
+            Settlement.query.filter_by(group_id=group_id),
+            Settlement,
+            cursor=request.args.get("cursor"),
+            limit=limit
+        )
+        names = user_names(
+            [s.payer_id for s in settlements] + [s.receiver_id for s in settlements]
+        )
         result = []
 
         for s in settlements:
-            payer = User.query.get(s.payer_id)
-            receiver = User.query.get(s.receiver_id)
-            if payer and receiver:
+            if s.payer_id in names and s.receiver_id in names:
                 result.append({
                     "id": s.id,
-                    "amount": s.amount,
-                    "payer_name": payer.name,
-                    "receiver_name": receiver.name,
+                    "amount": from_cents(s.amount_cents),
+                    "payer_name": names[s.payer_id],
+                    "receiver_name": names[s.receiver_id],
                     "created_at": s.created_at.isoformat()
                 })
 
-        return jsonify(result)
+        return paginated_response(result, next_cursor, limit)
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
     except Exception as e:
         return jsonify({"error": "Failed to fetch settlements"}), 500
 
 
+# --------------------------------------------------
+# CHANGE FEED
+# --------------------------------------------------
+
+@app.route("/api/groups/<int:group_id>/events")
+def group_events_feed(group_id):
+    marker = group_marker(group_id)
+    if marker is None:
+        return jsonify({"error": "Group not found"}), 404
+
+    if hub.stream_count() >= max_streams(app):
+        response = jsonify({"error": "Too many open event streams"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+
+    try:
+        last_event_id = int(request.headers["Last-Event-ID"])
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    # Not stream_with_context: the stream must not hold the request's DB session
+    subscription = subscribe(app, group_id, marker.version)
+    stream = event_stream(subscription, last_event_id, keepalive=app.config["GROUP_EVENTS_KEEPALIVE_SECONDS"])
+    response = Response(stream, mimetype="text/event-stream")
+    # Also covers a response closed before the stream started
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/sync")
+def sync():
+    """Changes to the session user's groups since `since`, oldest first.
+
+    Without `since` only the current cursor is returned: load the groups
+    through the regular endpoints, then sync from it. A 410 means the
+    cursor predates pruned changes and the client must reload.
+    """
+    user_id = session.get("user_id")
+    if user_id is None:
+        return jsonify({"error": "Login required"}), 401
+
+    settle = app.config["SYNC_SETTLE_SECONDS"]
+    try:
+        if request.args.get("since") is None:
+            return jsonify({"changes": [], "cursor": head_cursor(settle), "has_more": False, "resync_groups": []})
+
+        try:
+            since = int(request.args["since"])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        limit = parse_limit(request.args.get("limit"))
+        changes, cursor, has_more = sync_page(user_id, since, limit, settle)
+        return jsonify({
+            "changes": changes,
+            "cursor": cursor,
+            "has_more": has_more,
+            # Groups the user just joined; their history predates the cursor
+            "resync_groups": sorted({
+                c["group_id"] for c in changes
+                if c["entity"] == "membership" and c["id"] == user_id and c["op"] == "upsert"
+            }),
+        })
+    except CursorExpired:
+        return jsonify({"error": "Cursor expired; reload and sync from a new cursor"}), 410
+    except Exception as e:
+        return jsonify({"error": "Failed to sync"}), 500
+
+
+# --------------------------------------------------
+# IMPORT / EXPORT
+# --------------------------------------------------
+
+RECORD_READERS = {
+    "csv": iter_csv_records,
+    "ndjson": iter_ndjson_records,
+}
+
+
+@app.route("/api/groups/<int:group_id>/import", methods=["POST"])
+def import_group_expenses(group_id):
+    fmt = request.args.get("format")
+    if not fmt:
+        fmt = "csv" if request.mimetype == "text/csv" else "ndjson"
+
+    if fmt not in RECORD_READERS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    if not live_group(group_id):
+        return jsonify({"error": "Group not found"}), 404
+
+    if respond_async():
+        path = None
+        try:
+            job = enqueue("import_expenses", group_id=group_id, fmt=fmt)
+            path = job_file(app, job.id, fmt)
+            with open(path, "wb") as upload:
+                shutil.copyfileobj(request.stream, upload)
+            job_id = job.id
+            db.session.commit()
+            return accepted(job_id)
+        except Exception as e:
+            db.session.rollback()
+            if path and os.path.exists(path):
+                os.remove(path)
+            return jsonify({"error": "Import failed"}), 500
+
+    try:
+        report = import_expenses(group_id, RECORD_READERS[fmt](request.stream))
+        return jsonify(report)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Import failed"}), 500
+
+
+EXPORT_WRITERS = {
+    "csv": (export_csv, "text/csv"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+}
+
+
+@app.route("/api/groups/<int:group_id>/export")
+def export_group(group_id):
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_WRITERS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    if not live_group(group_id):
+        return jsonify({"error": "Group not found"}), 404
+
+    if respond_async():
+        try:
+            job_id = enqueue("export_group", group_id=group_id, fmt=fmt).id
+            db.session.commit()
+            return accepted(job_id)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": "Export failed"}), 500
+
+    writer, mimetype = EXPORT_WRITERS[fmt]
+    response = Response(stream_with_context(writer(group_id)), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=group-{group_id}.{fmt}"
+    return response
+
+
+# --------------------------------------------------
+# BACKGROUND JOBS
+# --------------------------------------------------
+
+def respond_async():
+    return "respond-async" in request.headers.get("Prefer", "")
+
+
+def accepted(job_id):
+    # Takes the id read before the commit: reloading the expired job could hit a lagging replica
+    response = jsonify({"job_id": job_id, "status": "queued"})
+    response.status_code = 202
+    response.headers["Location"] = url_for("job_status", job_id=job_id)
+    return response
+
+
+@job_type("purge_group", concurrency=2)
+def purge_group_job(job, group_id):
+    return purge_group(group_id, progress=lambda table, deleted: job.progress(**{table: deleted}))
+
+
+@job_type("rebuild_balances")
+def rebuild_balances_job(job, group_id):
+    try:
+        bump_group_version(group_id)
+    except GroupNotFound:
+        raise JobFailed(f"group {group_id} not found")
+
+    drift = ledger_drift(group_id)
+    rebuild_ledger(group_id)
+    db.session.commit()
+    return {"drifted_users": sorted(drift)}
+
+
+# Not retried: a second attempt would insert the rows of committed chunks again
+@job_type("import_expenses", concurrency=2, max_attempts=1)
+def import_expenses_job(job, group_id, fmt):
+    path = job_file(app, job.id, fmt)
+    try:
+        with open(path, "rb") as stream:
+            return import_expenses(group_id, RECORD_READERS[fmt](stream), progress=job.progress)
+    finally:
+        os.remove(path)
+
+
+@job_type("export_group", concurrency=2)
+def export_group_job(job, group_id, fmt):
+    if not live_group(group_id):
+        raise JobFailed(f"group {group_id} not found")
+
+    writer, mimetype = EXPORT_WRITERS[fmt]
+    with open(job_file(app, job.id, fmt), "w", encoding="utf-8", newline="") as out:
+        for chunk in writer(group_id):
+            out.write(chunk)
+    return {"mimetype": mimetype, "filename": f"group-{group_id}.{fmt}"}
+
+
+@job_type("snapshot_balances", every=app.config["BALANCE_SNAPSHOT_INTERVAL"] or None)
+def snapshot_balances_job(job):
+    taken = 0
+    for group_id in snapshot_due_groups(app.config["BALANCE_SNAPSHOT_WRITES"]):
+        if take_balance_snapshot(group_id):
+            taken += 1
+        db.session.commit()
+        job.progress(snapshots=taken)
+    return {"snapshots": taken}
+
+
+@app.route("/api/groups/<int:group_id>/rebuild-balances", methods=["POST"])
+def rebuild_group_balances(group_id):
+    if not live_group(group_id):
+        return jsonify({"error": "Group not found"}), 404
+
+    try:
+        job_id = enqueue("rebuild_balances", group_id=group_id).id
+        db.session.commit()
+        return accepted(job_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Failed to queue rebuild"}), 500
+
+
+@app.route("/api/jobs")
+def list_jobs():
+    try:
+        limit = parse_limit(request.args.get("limit"))
+        query = Job.query
+        if request.args.get("status"):
+            if request.args["status"] not in JOB_STATUSES:
+                return jsonify({"error": f"status must be one of {', '.join(JOB_STATUSES)}"}), 400
+            query = query.filter(Job.status == request.args["status"])
+        if request.args.get("type"):
+            query = query.filter(Job.type == request.args["type"])
+
+        rows, next_cursor = keyset_page(query, Job, request.args.get("cursor"), limit)
+        return paginated_response([job_json(job) for job in rows], next_cursor, limit)
+    except InvalidCursor:
+        return jsonify({"error": "Invalid cursor"}), 400
+    except Exception as e:
+        return jsonify({"error": "Failed to fetch jobs"}), 500
+
+
+@app.route("/api/jobs/<int:job_id>")
+def job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_json(job))
+
+
+@app.route("/api/jobs/<int:job_id>/download")
+def download_job_file(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or job.type != "export_group":
+        return jsonify({"error": "Job not found"}), 404
+    if job.status != "succeeded":
+        return jsonify({"error": f"Job is {job.status}"}), 409
+
+    path = job_file(app, job.id, job.params["fmt"])
+    if not os.path.exists(path):
+        return jsonify({"error": "Export file no longer exists"}), 410
+    return send_file(path, mimetype=job.result["mimetype"], as_attachment=True,
+                     download_name=job.result["filename"])
+
+
 # --------------------------------------------------
 # HTML Routes
 # --------------------------------------------------
@@ -405,12 +902,12 @@ def login_page():
         email = request.form["email"]
         password = request.form["password"]
 
-        user = User.query.filter_by(email=email).first()
-        if not user or not check_password_hash(user.password, password):
+        user = authenticate(email, password)
+        if not user:
             flash("Invalid email or password", "error")
             return redirect("/login")
 
-        session["user_id"] = user.id
+        login_user(user)
         
         promote_first_user_to_admin()
         
@@ -439,7 +936,7 @@ def create_user():
             user = User(
                 name=name,
                 email=email,
-                password=generate_password_hash(password),
+                password=hash_password(password),
                 role="user"
             )
 
@@ -473,7 +970,7 @@ def register_page():
         user = User(
             name=request.form["name"],
             email=email,
-            password=generate_password_hash(request.form["password"])
+            password=hash_password(request.form["password"])
         )
 
         try:
@@ -497,29 +994,25 @@ def dashboard():
 
     user_id = session["user_id"]
 
-    groups = (
-        db.session.query(Group)
-        .outerjoin(GroupMember, Group.id == GroupMember.group_id)
-        .filter(
-            or_(
-                Group.created_by == user_id,
-                GroupMember.user_id == user_id
-            )
+    result = groups_with_member_counts(
+        or_(
+            Group.created_by == user_id,
+            Group.id.in_(select(GroupMember.group_id).where(GroupMember.user_id == user_id))
         )
-        .distinct()
-        .all()
     )
 
-    result = []
-    for g in groups:
-        count = GroupMember.query.filter_by(group_id=g.id).count()
-        result.append({
-            "id": g.id,
-            "name": g.name,
-            "member_count": count
-        })
+    summary = balance_summary(user_id)
+    nets = {g["group_id"]: from_cents(g["net_cents"]) for g in summary["groups"]}
+    for g in result:
+        g["net"] = nets.get(g["id"])
 
-    return render_template("dashboard.html", groups=result)
+    return render_template(
+        "dashboard.html",
+        groups=result,
+        owed_to_you=from_cents(summary["owed_to_you_cents"]),
+        you_owe=from_cents(summary["you_owe_cents"]),
+        total=from_cents(summary["total_cents"]),
+    )
 
 
 @app.route("/groups/new", methods=["GET", "POST"])
@@ -549,7 +1042,7 @@ def new_group():
         # Create group
         group = Group(name=group_name, created_by=current_user_id)
         db.session.add(group)
-        db.session.commit()
+        db.session.flush()
 
         # Always add creator
         db.session.add(
@@ -562,6 +1055,8 @@ def new_group():
                 GroupMember(group_id=group.id, user_id=int(uid))
             )
 
+        add_ledger_members(group.id, [current_user_id] + [int(uid) for uid in member_ids])
+        record_group_created(group.id, [current_user_id] + [int(uid) for uid in member_ids])
         db.session.commit()
         flash("Group created successfully", "success")
         return redirect("/dashboard")
@@ -591,7 +1086,9 @@ def add_members(group_id):
         flash("You must be a member of this group", "error")
         return redirect("/dashboard")
 
-    group = Group.query.get_or_404(group_id)
+    group = live_group(group_id)
+    if not group:
+        abort(404)
 
     # Users not already in group
     existing_ids = [
@@ -622,11 +1119,17 @@ def add_members(group_id):
         )
 
     try:
+        bump_group_version(group_id)
+
         for uid in member_ids:
             db.session.add(
                 GroupMember(group_id=group_id, user_id=int(uid))
             )
 
+        add_ledger_members(group_id, [int(uid) for uid in member_ids])
+        queue_group_event(group_id, "members", user_ids=[int(uid) for uid in member_ids])
+        for uid in member_ids:
+            record_change(group_id, "membership", int(uid))
         db.session.commit()
         flash("Members added successfully", "success")
         return redirect(f"/groups/{group_id}")
@@ -640,143 +1143,164 @@ def add_members(group_id):
         )
 
 
-@app.route("/groups/<int:group_id>")
-@login_required
-def group_page(group_id):
-    
+GROUP_PAGE_HISTORY_SIZE = 20
 
-    # Basic authorization
-    member = GroupMember.query.filter_by(
-        group_id=group_id,
-        user_id=session["user_id"]
-    ).first()
 
-    if not member:
-        flash("You don't have access to this group", "error")
-        return redirect("/dashboard")
+def build_group_view(group_id, expenses_cursor, settlements_cursor):
+    """Everything group.html shows about a group, as plain cacheable data."""
+    balances_raw = calculate_balances(group_id)
+
+    members = [
+        {"id": uid, "name": name}
+        for uid, name in db.session.execute(
+            select(User.id, User.name)
+            .join(GroupMember, User.id == GroupMember.user_id)
+            .where(GroupMember.group_id == group_id)
+        )
+    ]
 
-    group = Group.query.get_or_404(group_id)
+    expenses, expenses_next = keyset_page(
+        Expense.query.filter_by(group_id=group_id),
+        Expense,
+        cursor=expenses_cursor,
+        limit=GROUP_PAGE_HISTORY_SIZE
+    )
+    settlements, settlements_next = keyset_page(
+        Settlement.query.filter_by(group_id=group_id),
+        Settlement,
+        cursor=settlements_cursor,
+        limit=GROUP_PAGE_HISTORY_SIZE
+    )
+
+    suggestions_raw = suggest_settlements(group_id, balances_raw)
+
+    # Resolve every name the page needs in one lookup
+    user_ids = set(balances_raw)
+    user_ids.update(e.paid_by for e in expenses)
+    for s in suggestions_raw:
+        user_ids.update((s["from"], s["to"]))
+    for s in settlements:
+        user_ids.update((s.payer_id, s.receiver_id))
+    names = user_names(user_ids)
 
-    balances_raw = calculate_balances(group_id)
     balances = []
     for uid, bal in balances_raw.items():
-        user = User.query.get(uid)
-        if user:
+        if uid in names:
             balances.append({
                 "user_id": uid,  # Added for settlement form
-                "name": user.name,
-                "balance": round(bal, 2)
+                "name": names[uid],
+                "balance": from_cents(bal)
             })
 
-    members = (
-        db.session.query(User)
-        .join(GroupMember, User.id == GroupMember.user_id)
-        .filter(GroupMember.group_id == group_id)
-        .all()
-    )
-
-    expenses = Expense.query.filter_by(group_id=group_id).order_by(Expense.created_at.desc()).all()
-
     expense_data = []
     for e in expenses:
-        payer = User.query.get(e.paid_by)
-        if payer:
+        if e.paid_by in names:
             expense_data.append({
-                "amount": e.amount,
+                "amount": from_cents(e.amount_cents),
                 "description": e.description,
-                "payer_name": payer.name,
+                "payer_name": names[e.paid_by],
                 "created_at": e.created_at
             })
-        
-    suggestions_raw = suggest_settlements(group_id)
 
     suggestions = []
     for s in suggestions_raw:
-        from_user = User.query.get(s["from"])
-        to_user = User.query.get(s["to"])
-        if from_user and to_user:
+        if s["from"] in names and s["to"] in names:
             suggestions.append({
                 "from_id": s["from"],
-                "from_name": from_user.name,
+                "from_name": names[s["from"]],
                 "to_id": s["to"],
-                "to_name": to_user.name,
+                "to_name": names[s["to"]],
                 "amount": s["amount"]
             })
-        
-    settlements = (
-        Settlement.query
-        .filter_by(group_id=group_id)
-        .order_by(Settlement.created_at.desc())
-        .all()
-    )
 
     settlement_data = []
     for s in settlements:
-        payer = User.query.get(s.payer_id)
-        receiver = User.query.get(s.receiver_id)
-        if payer and receiver:
+        if s.payer_id in names and s.receiver_id in names:
             settlement_data.append({
-                "amount": s.amount,
-                "payer_name": payer.name,
-                "receiver_name": receiver.name,
+                "amount": from_cents(s.amount_cents),
+                "payer_name": names[s.payer_id],
+                "receiver_name": names[s.receiver_id],
                 "created_at": s.created_at
             })
 
-    return render_template(
-        "group.html",
-        group=group,
-        balances=balances,
-        members=members,
-        expenses=expense_data,
-        suggestions=suggestions,
-        settlements=settlement_data
-    )
+    return {
+        "balances": balances,
+        "members": members,
+        "expenses": expense_data,
+        "suggestions": suggestions,
+        "settlements": settlement_data,
+        "expenses_next": expenses_next,
+        "settlements_next": settlements_next,
+    }
 
 
-@app.route("/expenses/add", methods=["POST"])
+@app.route("/groups/<int:group_id>")
 @login_required
-def add_expense_form():
+def group_page(group_id):
 
-    try:
-        group_id = int(request.form["group_id"])
-        amount = float(request.form["amount"])
-        paid_by = int(request.form["paid_by"])
-        description = request.form.get("description", "")
+    # Basic authorization; also fetches the version the view cache is keyed on
+    group = db.session.execute(
+        select(Group)
+        .join(GroupMember, GroupMember.group_id == Group.id)
+        .where(
+            Group.id == group_id,
+            Group.deleted_at.is_(None),
+            GroupMember.user_id == session["user_id"]
+        )
+        .limit(1)
+    ).scalar()
 
-        # Validate amount
-        if amount <= 0:
-            flash("Amount must be greater than zero", "error")
-            return redirect(f"/groups/{group_id}")
+    if not group:
+        flash("You don't have access to this group", "error")
+        return redirect("/dashboard")
 
-        expense = Expense(
-            group_id=group_id,
-            amount=amount,
-            paid_by=paid_by,
-            description=description
+    # The page shows the viewer's name and admin links, so the validator is per user and role
+    etag = f"group-page-{group_id}-{group.version}-{session['user_id']}-{current_role()}"
+    if not_modified(etag):
+        return set_validators(Response(status=304), etag, weak=True)
+
+    try:
+        view = cached_group_view(
+            group_id, group.version, "group_page", build_group_view,
+            request.args.get("expenses_cursor"),
+            request.args.get("settlements_cursor")
         )
-        db.session.add(expense)
-        db.session.commit()
+    except InvalidCursor:
+        return redirect(f"/groups/{group_id}")
 
-        members = GroupMember.query.filter_by(group_id=group_id).all()
-        
-        if not members:
-            flash("No members in group", "error")
-            return redirect(f"/groups/{group_id}")
-            
-        split_amount = amount / len(members)
+    response = make_response(render_template("group.html", group=group, **view))
+    set_validators(response, etag, weak=True)
+    response.cache_control.private = True
+    response.vary.add("Cookie")
+    return response
 
-        for m in members:
-            db.session.add(
-                ExpenseSplit(
-                    expense_id=expense.id,
-                    user_id=m.user_id,
-                    amount_owed=split_amount
-                )
-            )
 
-        db.session.commit()
+@app.route("/expenses/add", methods=["POST"])
+@login_required
+def add_expense_form():
+
+    try:
+        group_id = int(request.form["group_id"])
+        split_type = request.form.get("split_type", "equal")
+
+        # Per-member inputs are named split_<user_id>; blanks are left out
+        values = {
+            key[len("split_"):]: value
+            for key, value in request.form.items()
+            if key.startswith("split_") and key != "split_type" and value.strip()
+        }
+
+        record_expense(
+            group_id, int(request.form["paid_by"]), to_cents(request.form["amount"]),
+            split_type, values if split_type != "equal" else None,
+            request.form.get("description", "")
+        )
         flash("Expense added successfully", "success")
         return redirect(f"/groups/{group_id}")
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "error")
+        return redirect(f"/groups/{group_id}")
     except Exception as e:
         db.session.rollback()
         flash("Failed to add expense", "error")
@@ -791,25 +1315,32 @@ def add_settlement_form():
         group_id = int(request.form["group_id"])
         payer_id = int(request.form["payer_id"])
         receiver_id = int(request.form["receiver_id"])
-        amount = float(request.form["amount"])
+        amount_cents = to_cents(request.form["amount"])
 
         # Sanity checks
         if payer_id == receiver_id:
             flash("Payer and receiver cannot be the same", "error")
             return redirect(f"/groups/{group_id}")
             
-        if amount <= 0:
+        if amount_cents <= 0:
             flash("Amount must be greater than zero", "error")
             return redirect(f"/groups/{group_id}")
 
+        bump_group_version(group_id)
+
         new_settlement = Settlement(
             group_id=group_id,
             payer_id=payer_id,
             receiver_id=receiver_id,
-            amount=amount
+            amount_cents=amount_cents
         )
 
         db.session.add(new_settlement)
+        apply_balance_deltas(group_id, [
+            (payer_id, amount_cents),
+            (receiver_id, -amount_cents)
+        ])
+        queue_settlement_event(new_settlement)
         db.session.commit()
         
         flash("Settlement recorded successfully", "success")
@@ -822,31 +1353,22 @@ def add_settlement_form():
 @app.route("/groups/<int:group_id>/delete", methods=["POST"])
 @admin_only
 def delete_group(group_id):
-    group = Group.query.get_or_404(group_id)
-
+    # Hide the group now; a background job purges its rows in batches
     try:
-        # delete related data first (important)
-        ExpenseSplit.query.filter(
-            ExpenseSplit.expense_id.in_(
-                db.session.query(Expense.id).filter_by(group_id=group_id)
-            )
-        ).delete(synchronize_session=False)
-
-        Expense.query.filter_by(group_id=group_id).delete()
-        Settlement.query.filter_by(group_id=group_id).delete()
-        GroupMember.query.filter_by(group_id=group_id).delete()
-
-        db.session.delete(group)
+        deleted = soft_delete_group(group_id)
+        if deleted:
+            enqueue("purge_group", group_id=group_id)
+            queue_group_event(group_id, "deleted")
+            record_group_deleted(group_id)
         db.session.commit()
-
     except Exception as e:
         db.session.rollback()
         return "Failed to delete group", 500
 
-    return redirect("/dashboard")
-
-
+    if not deleted:
+        abort(404)
 
+    return redirect("/dashboard")
 
 
 @app.route("/logout")
@@ -856,12 +1378,185 @@ def logout():
     return redirect("/login")
 
 
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+
+@app.cli.command("rebuild-balances")
+@click.option("--group-id", type=int, help="Only process this group.")
+@click.option("--verify", is_flag=True, help="Report drift without rewriting the ledger.")
+def rebuild_balances_command(group_id, verify):
+    """Recompute the group_balances ledger from expense history."""
+    if group_id:
+        group_ids = [group_id]
+    else:
+        group_ids = db.session.execute(
+            select(Group.id).where(Group.deleted_at.is_(None)).order_by(Group.id)
+        ).scalars().all()
+
+    drifted = 0
+    for gid in group_ids:
+        drift = ledger_drift(gid)
+        if drift:
+            drifted += 1
+            for uid, (stored, actual) in sorted(drift.items()):
+                click.echo(f"group {gid} user {uid}: ledger={stored if stored is None else format_cents(stored)} actual={format_cents(actual)}")
+
+        if not verify:
+            if drift:
+                # Cached views and ETags still carry the drifted balances
+                try:
+                    bump_group_version(gid)
+                except GroupNotFound:
+                    pass  # deleted; nothing serves its views any more
+            rebuild_ledger(gid)
+            db.session.commit()
+
+    click.echo(f"{len(group_ids)} groups checked, {drifted} with drift"
+               + ("" if verify else ", ledger rebuilt"))
+
+
+@app.cli.command("import-expenses")
+@click.argument("group_id", type=int)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(sorted(RECORD_READERS)),
+              help="Defaults to the file extension.")
+def import_expenses_command(group_id, path, fmt):
+    """Bulk import expenses for a group from a CSV or NDJSON file."""
+    if not fmt:
+        fmt = "csv" if path.lower().endswith(".csv") else "ndjson"
+
+    with open(path, "rb") as stream:
+        report = import_expenses(group_id, RECORD_READERS[fmt](stream))
+
+    for error in report["errors"]:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"{report['imported']} imported, {report['failed']} failed")
+
+
+@app.cli.command("purge-groups")
+@click.option("--batch-size", type=int, default=1000, show_default=True)
+def purge_groups_command(batch_size):
+    """Purge deleted groups in the foreground instead of through the job queue."""
+    group_ids = deleted_group_ids()
+    for gid in group_ids:
+        counts = purge_group(
+            gid, batch_size,
+            progress=lambda table, n: click.echo(f"group {gid}: {n} {table} deleted")
+        )
+        click.echo(f"group {gid} purged: {counts}")
+
+    click.echo(f"{len(group_ids)} deleted groups purged")
+
+
+@app.cli.command("compact-splits")
+@click.option("--group-id", type=int, help="Only process this group.")
+def compact_splits_command(group_id):
+    """Store existing even splits as member sets instead of per-user rows."""
+    if group_id:
+        group_ids = [group_id]
+    else:
+        group_ids = db.session.execute(
+            select(Group.id).where(Group.deleted_at.is_(None)).order_by(Group.id)
+        ).scalars().all()
+
+    compacted = 0
+    for gid in group_ids:
+        compacted += compact_group_splits(gid)
+        drift = ledger_drift(gid)
+        if drift:
+            click.echo(f"group {gid}: balances changed for users {sorted(drift)}", err=True)
+
+    click.echo(f"{len(group_ids)} groups checked, {compacted} expenses compacted")
+
+
+@app.cli.command("snapshot-balances")
+@click.option("--group-id", type=int, help="Only process this group.")
+@click.option("--full", is_flag=True, help="Sum all history instead of the previous snapshot plus new rows.")
+@click.option("--verify", is_flag=True, help="Check the latest snapshots against full history instead.")
+def snapshot_balances_command(group_id, full, verify):
+    """Checkpoint group balances so recomputes only sum newer rows."""
+    if group_id:
+        group_ids = [group_id]
+    else:
+        group_ids = db.session.execute(
+            select(Group.id).where(Group.deleted_at.is_(None)).order_by(Group.id)
+        ).scalars().all()
+
+    invalid = 0
+    for gid in group_ids:
+        if verify:
+            drift = verify_balance_snapshot(gid)
+            if drift:
+                invalid += 1
+                click.echo(f"group {gid}: snapshot wrong for users {sorted(drift)}, deleted", err=True)
+        elif take_balance_snapshot(gid, full=full) is None:
+            invalid += 1
+            click.echo(f"group {gid}: balances do not add up to zero, not snapshotted", err=True)
+        db.session.commit()
+
+    if verify:
+        click.echo(f"{len(group_ids)} groups checked, {invalid} invalid snapshots deleted")
+    else:
+        click.echo(f"{len(group_ids) - invalid} groups snapshotted")
+
+
+@app.cli.command("run-jobs")
+def run_jobs_command():
+    """Run the background job runner in this process until interrupted."""
+    runner = start_job_runner(app)
+    if runner is None:
+        raise click.ClickException("JOBS_ENABLED is off")
+
+    click.echo(f"running jobs with {runner.workers} workers")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+@app.cli.command("prune-jobs")
+@click.option("--days", type=int, default=7, show_default=True,
+              help="Delete finished jobs older than this.")
+def prune_jobs_command(days):
+    """Delete old finished jobs and their files."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    jobs = db.session.execute(
+        select(Job.id, Job.params).where(Job.status.in_(("succeeded", "failed")), Job.finished_at < cutoff)
+    ).all()
+
+    for job_id, params in jobs:
+        path = job_file(app, job_id, (params or {}).get("fmt", ""))
+        if os.path.exists(path):
+            os.remove(path)
+    db.session.execute(delete(Job).where(Job.id.in_([job_id for job_id, _ in jobs])))
+    db.session.commit()
+    click.echo(f"{len(jobs)} jobs pruned")
+
+
+@app.cli.command("prune-changes")
+@click.option("--days", type=int, default=30, show_default=True,
+              help="Delete sync changes older than this.")
+def prune_changes_command(days):
+    """Delete old sync changes; clients with older cursors must reload."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    newest = db.session.execute(select(func.max(Change.id))).scalar() or 0
+    # The newest row stays so that /api/sync can still tell which cursors are gone
+    pruned = db.session.execute(
+        delete(Change).where(Change.created_at < cutoff, Change.id < newest)
+    ).rowcount
+    db.session.commit()
+    click.echo(f"{pruned} changes pruned")
+
+
 # --------------------------------------------------
 # RUN
 # --------------------------------------------------
 
 with app.app_context():
     db.create_all()
+    upgrade_schema()
     
 if __name__ == "__main__":
     app.run(debug=True)
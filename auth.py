@@ -1,7 +1,73 @@
+import time
 from functools import wraps
-from flask import session, redirect
+from flask import session, redirect, request, g, current_app, has_request_context
+from sqlalchemy import event
 from models import db, User
 
+DEFAULT_ROLE_CACHE_TTL = 60
+
+# Requests that change state always re-read the role from the database
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _remember_role(user):
+    session["role"] = user.role
+    session["role_checked_at"] = int(time.time())
+
+
+def login_user(user):
+    """Start a session for `user`, caching its role alongside the id."""
+    session["user_id"] = user.id
+    _remember_role(user)
+    g.current_user = user
+
+
+def current_user():
+    """The logged-in User, loaded at most once per request (None if logged out)."""
+    if "user_id" not in session:
+        return None
+
+    if "current_user" not in g:
+        user = db.session.get(User, session["user_id"])
+        if user is None:
+            # Account deleted since login
+            session.clear()
+        elif user.role != session.get("role") or _role_expired():
+            _remember_role(user)
+        g.current_user = user
+
+    return g.current_user
+
+
+def _role_expired():
+    ttl = current_app.config.get("ROLE_CACHE_TTL", DEFAULT_ROLE_CACHE_TTL)
+    return time.time() - session.get("role_checked_at", 0) >= ttl
+
+
+def current_role(revalidate=False):
+    """Role of the logged-in user.
+
+    Served from the signed session cookie while it is younger than
+    ROLE_CACHE_TTL seconds; otherwise (or with `revalidate`) re-read from
+    the database so role changes take effect.
+    """
+    if "user_id" not in session:
+        return None
+
+    if revalidate or "role" not in session or _role_expired():
+        user = current_user()
+        return user.role if user else None
+
+    return session["role"]
+
+
+@event.listens_for(User, "after_update")
+def _refresh_session_role(mapper, connection, target):
+    # A role change made during this user's own request applies immediately;
+    # other sessions pick it up within ROLE_CACHE_TTL
+    if has_request_context() and session.get("user_id") == target.id:
+        _remember_role(target)
+
 
 def login_required(view):
     @wraps(view)
@@ -18,8 +84,10 @@ def admin_only(view):
         if "user_id" not in session:
             return redirect("/login")
 
-        user = db.session.get(User, session["user_id"])
-        if not user or user.role != "admin":
+        role = current_role(revalidate=request.method not in SAFE_METHODS)
+        if role is None:
+            return redirect("/login")
+        if role != "admin":
             return "Forbidden", 403
 
         return view(*args, **kwargs)
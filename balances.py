@@ -0,0 +1,478 @@
+# balances.py
+import logging
+from collections import namedtuple
+from sqlalchemy import case, delete, event, func, insert, literal, select, union_all, update
+from models import (
+    db, Group, GroupMember, GroupBalance, Expense, ExpenseSplit, MemberSetMember, Settlement,
+    BalanceSnapshot, BalanceSnapshotEntry
+)
+from member_sets import compact_splits
+
+logger = logging.getLogger(__name__)
+
+# Snapshots kept per group; older ones are deleted when a new one is taken
+SNAPSHOTS_KEPT = 2
+
+# A snapshot's id and watermark, as values or as SQL expressions
+Watermark = namedtuple("Watermark", "id last_expense_id last_settlement_id")
+
+
+def _balance_deltas(group_id, snapshot=None, upto=None):
+    """Signed per-user amounts for a group, one row per user and source.
+
+    With a `snapshot` (a Watermark, or a row with the same fields), its
+    entries are included and only expenses and settlements after its
+    watermark are summed. `upto` is an optional (last_expense_id,
+    last_settlement_id) pair that caps the range. Even splits stored as
+    member sets are expanded in SQL alongside the per-user split rows.
+    """
+    expense_range = [Expense.group_id == group_id]
+    settlement_range = [Settlement.group_id == group_id]
+    if snapshot is not None:
+        expense_range.append(Expense.id > snapshot.last_expense_id)
+        settlement_range.append(Settlement.id > snapshot.last_settlement_id)
+    if upto is not None:
+        expense_range.append(Expense.id <= upto[0])
+        settlement_range.append(Settlement.id <= upto[1])
+
+    paid = (
+        select(Expense.paid_by.label("user_id"), func.sum(Expense.amount_cents).label("delta"))
+        .where(*expense_range)
+        .group_by(Expense.paid_by)
+    )
+
+    owed = (
+        select(ExpenseSplit.user_id.label("user_id"), -func.sum(ExpenseSplit.amount_owed_cents))
+        .join(Expense, Expense.id == ExpenseSplit.expense_id)
+        .where(*expense_range)
+        .group_by(ExpenseSplit.user_id)
+    )
+
+    compact = compact_splits(db.and_(*expense_range)).subquery()
+    owed_compact = (
+        select(compact.c.user_id, -func.sum(compact.c.amount_owed_cents))
+        .group_by(compact.c.user_id)
+    )
+
+    settled_out = (
+        select(Settlement.payer_id.label("user_id"), func.sum(Settlement.amount_cents))
+        .where(*settlement_range)
+        .group_by(Settlement.payer_id)
+    )
+
+    settled_in = (
+        select(Settlement.receiver_id.label("user_id"), -func.sum(Settlement.amount_cents))
+        .where(*settlement_range)
+        .group_by(Settlement.receiver_id)
+    )
+
+    parts = [paid, owed, owed_compact, settled_out, settled_in]
+    if snapshot is not None:
+        parts.append(
+            select(BalanceSnapshotEntry.user_id, BalanceSnapshotEntry.net_cents)
+            .where(BalanceSnapshotEntry.snapshot_id == snapshot.id)
+        )
+
+    return union_all(*parts).subquery()
+
+
+def _sum_deltas(deltas):
+    rows = db.session.execute(
+        select(deltas.c.user_id, func.coalesce(func.sum(deltas.c.delta), literal(0)))
+        .group_by(deltas.c.user_id)
+    )
+    return {user_id: int(net) for user_id, net in rows}
+
+
+def _latest_watermark(group_id):
+    """The group's latest snapshot as scalar subqueries, so the lookup runs inside the sum query.
+
+    Without a snapshot the id is NULL (no entries) and the watermark 0.
+    """
+    latest = (
+        select(BalanceSnapshot.id, BalanceSnapshot.last_expense_id, BalanceSnapshot.last_settlement_id)
+        .where(BalanceSnapshot.group_id == group_id)
+        .order_by(BalanceSnapshot.id.desc())
+        .limit(1)
+        .subquery()
+    )
+    return Watermark(
+        select(latest.c.id).scalar_subquery(),
+        func.coalesce(select(latest.c.last_expense_id).scalar_subquery(), 0),
+        func.coalesce(select(latest.c.last_settlement_id).scalar_subquery(), 0),
+    )
+
+
+def compute_balances(group_id, full=False):
+    """Net balance per member, in cents, recomputed from group history.
+
+    Starts from the latest balance snapshot and only sums the expenses
+    and settlements after its watermark, unless `full` is set or there is
+    no snapshot. Runs two queries regardless of history size: one for
+    the member list and one UNION ALL of per-table GROUP BY sums.
+    """
+    balances = {}
+
+    members = db.session.execute(
+        select(GroupMember.user_id)
+        .where(GroupMember.group_id == group_id)
+        .order_by(GroupMember.id)
+    ).scalars()
+    for user_id in members:
+        balances[user_id] = 0
+
+    snapshot = None if full else _latest_watermark(group_id)
+    for user_id, net in _sum_deltas(_balance_deltas(group_id, snapshot)).items():
+        balances[user_id] = balances.get(user_id, 0) + net
+
+    return balances
+
+
+def calculate_balances(group_id):
+    """Net balance per member in cents, read from the group_balances ledger.
+
+    Falls back to recomputing from history (snapshot plus newer rows) for
+    groups whose ledger has not been built yet (see `flask rebuild-balances`).
+    """
+    rows = db.session.execute(
+        select(GroupMember.user_id, GroupBalance.net_cents)
+        .outerjoin(
+            GroupBalance,
+            (GroupBalance.group_id == GroupMember.group_id)
+            & (GroupBalance.user_id == GroupMember.user_id)
+        )
+        .where(GroupMember.group_id == group_id)
+        .order_by(GroupMember.id)
+    ).all()
+
+    if any(net is None for _, net in rows):
+        return compute_balances(group_id)
+
+    return {user_id: net for user_id, net in rows}
+
+
+def user_balances(user_id):
+    """(group_id, name, net cents) for every live group of a user, in one query.
+
+    Reads the user's group_balances rows, so the cost grows with the
+    number of groups, not their history. Groups without a ledger row for
+    the user are summed from history in one more query for all of them.
+    """
+    rows = db.session.execute(
+        select(Group.id, Group.name, GroupBalance.net_cents)
+        .join(GroupMember, GroupMember.group_id == Group.id)
+        .outerjoin(
+            GroupBalance,
+            (GroupBalance.group_id == Group.id) & (GroupBalance.user_id == user_id)
+        )
+        .where(GroupMember.user_id == user_id, Group.deleted_at.is_(None))
+        .order_by(Group.id)
+    ).all()
+
+    missing = [group_id for group_id, _, net in rows if net is None]
+    computed = _user_history_nets(user_id, missing) if missing else {}
+    return [
+        (group_id, name, computed.get(group_id, 0) if net is None else net)
+        for group_id, name, net in rows
+    ]
+
+
+def _user_history_nets(user_id, group_ids):
+    """{group_id: net cents} of one user, summed from expenses, splits and settlements."""
+    compact = compact_splits(
+        Expense.group_id.in_(group_ids) & (MemberSetMember.user_id == user_id)
+    ).subquery()
+    paid = (
+        select(Expense.group_id, func.sum(Expense.amount_cents).label("net"))
+        .where(Expense.group_id.in_(group_ids), Expense.paid_by == user_id)
+        .group_by(Expense.group_id)
+    )
+    owed = (
+        select(Expense.group_id, -func.sum(ExpenseSplit.amount_owed_cents))
+        .join(ExpenseSplit, ExpenseSplit.expense_id == Expense.id)
+        .where(Expense.group_id.in_(group_ids), ExpenseSplit.user_id == user_id)
+        .group_by(Expense.group_id)
+    )
+    owed_compact = (
+        select(Expense.group_id, -func.sum(compact.c.amount_owed_cents))
+        .join(compact, compact.c.expense_id == Expense.id)
+        .group_by(Expense.group_id)
+    )
+    settled = (
+        select(Settlement.group_id, func.sum(case(
+            (Settlement.payer_id == user_id, Settlement.amount_cents), else_=-Settlement.amount_cents
+        )))
+        .where(Settlement.group_id.in_(group_ids),
+               (Settlement.payer_id == user_id) | (Settlement.receiver_id == user_id))
+        .group_by(Settlement.group_id)
+    )
+
+    nets = {}
+    for group_id, net in db.session.execute(union_all(paid, owed, owed_compact, settled)):
+        nets[group_id] = nets.get(group_id, 0) + (net or 0)
+    return nets
+
+
+# --------------------------------------------------
+# LEDGER MAINTENANCE
+# --------------------------------------------------
+
+def _ledger_initialized(group_id):
+    return db.session.execute(
+        select(GroupBalance.user_id).where(GroupBalance.group_id == group_id).limit(1)
+    ).first() is not None
+
+
+def read_ledger(group_id):
+    return dict(db.session.execute(
+        select(GroupBalance.user_id, GroupBalance.net_cents)
+        .where(GroupBalance.group_id == group_id)
+    ).all())
+
+
+def rebuild_ledger(group_id):
+    """Replace the ledger rows of a group with a full recompute. Does not commit.
+
+    Ignores balance snapshots, so a bad snapshot cannot leak into the ledger.
+    """
+    balances = compute_balances(group_id, full=True)
+
+    db.session.execute(delete(GroupBalance).where(GroupBalance.group_id == group_id))
+    if balances:
+        db.session.execute(
+            insert(GroupBalance),
+            [{"group_id": group_id, "user_id": uid, "net_cents": net} for uid, net in balances.items()]
+        )
+
+    return balances
+
+
+def apply_balance_deltas(group_id, deltas):
+    """Add signed cent amounts to the ledger inside the caller's transaction.
+
+    Must be called after the rows that produced the deltas have been added
+    to the session: a group without a ledger yet is rebuilt from history
+    instead, which already includes them.
+    """
+    totals = {}
+    for user_id, amount in deltas:
+        totals[user_id] = totals.get(user_id, 0) + amount
+    if not totals:
+        return
+
+    # One UPDATE for all users; the common case needs nothing else
+    result = db.session.execute(
+        update(GroupBalance)
+        .where(GroupBalance.group_id == group_id, GroupBalance.user_id.in_(totals))
+        .values(net_cents=GroupBalance.net_cents + case(totals, value=GroupBalance.user_id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == len(totals):
+        return
+
+    if result.rowcount == 0 and not _ledger_initialized(group_id):
+        rebuild_ledger(group_id)
+        return
+
+    existing = set(db.session.execute(
+        select(GroupBalance.user_id)
+        .where(GroupBalance.group_id == group_id, GroupBalance.user_id.in_(totals))
+    ).scalars())
+    db.session.execute(insert(GroupBalance), [
+        {"group_id": group_id, "user_id": user_id, "net_cents": amount}
+        for user_id, amount in totals.items() if user_id not in existing
+    ])
+
+
+def add_ledger_members(group_id, user_ids):
+    """Give newly added members a zero ledger row. Does not commit."""
+    if not _ledger_initialized(group_id):
+        rebuild_ledger(group_id)
+        return
+
+    existing = set(read_ledger(group_id))
+    for user_id in set(user_ids) - existing:
+        db.session.add(GroupBalance(group_id=group_id, user_id=user_id, net_cents=0))
+
+
+def delete_ledger(group_id):
+    db.session.execute(delete(GroupBalance).where(GroupBalance.group_id == group_id))
+
+
+def ledger_drift(group_id):
+    """Members whose stored net differs from a full recompute, as {user_id: (stored, actual)}."""
+    actual = compute_balances(group_id, full=True)
+    stored = read_ledger(group_id)
+
+    drift = {}
+    for user_id in set(actual) | set(stored):
+        a = actual.get(user_id, 0)
+        s = stored.get(user_id)
+        if s != a:
+            drift[user_id] = (s, a)
+
+    return drift
+
+
+# --------------------------------------------------
+# SNAPSHOTS
+# --------------------------------------------------
+
+def latest_snapshot(group_id):
+    return db.session.execute(
+        select(BalanceSnapshot.id, BalanceSnapshot.last_expense_id, BalanceSnapshot.last_settlement_id)
+        .where(BalanceSnapshot.group_id == group_id)
+        .order_by(BalanceSnapshot.id.desc())
+        .limit(1)
+    ).first()
+
+
+def take_balance_snapshot(group_id, full=False):
+    """Checkpoint a group's balances at its current newest expense and settlement. Does not commit.
+
+    Locks the group row first: every write bumps the group version before
+    inserting, so no transaction can still be adding rows below the
+    watermark. The new snapshot is built from the previous one plus the
+    rows since (or from all history with `full`), and is only saved if
+    its balances add up to zero. Returns the snapshot id, or None.
+    """
+    version = db.session.execute(
+        select(Group.version).where(Group.id == group_id, Group.deleted_at.is_(None)).with_for_update()
+    ).scalar()
+    if version is None:
+        return None
+
+    upto = (
+        db.session.execute(select(func.coalesce(func.max(Expense.id), 0)).where(Expense.group_id == group_id)).scalar(),
+        db.session.execute(select(func.coalesce(func.max(Settlement.id), 0)).where(Settlement.group_id == group_id)).scalar(),
+    )
+    previous = None if full else latest_snapshot(group_id)
+    if previous is not None and (previous.last_expense_id, previous.last_settlement_id) == upto:
+        return previous.id
+
+    balances = _sum_deltas(_balance_deltas(group_id, previous, upto))
+    if sum(balances.values()) != 0:
+        logger.error("not snapshotting group %s: balances add up to %d", group_id, sum(balances.values()))
+        return None
+
+    snapshot_id = db.session.execute(
+        insert(BalanceSnapshot)
+        .values(group_id=group_id, group_version=version, last_expense_id=upto[0],
+                last_settlement_id=upto[1])
+        .returning(BalanceSnapshot.id)
+    ).scalar_one()
+    if balances:
+        db.session.execute(insert(BalanceSnapshotEntry), [
+            {"snapshot_id": snapshot_id, "user_id": uid, "net_cents": net} for uid, net in balances.items()
+        ])
+
+    old = (
+        select(BalanceSnapshot.id)
+        .where(BalanceSnapshot.group_id == group_id)
+        .order_by(BalanceSnapshot.id.desc())
+        .offset(SNAPSHOTS_KEPT)
+    )
+    _delete_snapshots(BalanceSnapshot.id.in_(old))
+
+    return snapshot_id
+
+
+def verify_balance_snapshot(group_id):
+    """Compare the latest snapshot with a full recompute up to its watermark.
+
+    A snapshot that disagrees is deleted with all older ones (they were
+    chained from it or are older still). Returns {user_id: (snapshot,
+    actual)} for the users that differ. Does not commit.
+    """
+    snapshot = latest_snapshot(group_id)
+    if snapshot is None:
+        return {}
+
+    stored = dict(db.session.execute(
+        select(BalanceSnapshotEntry.user_id, BalanceSnapshotEntry.net_cents)
+        .where(BalanceSnapshotEntry.snapshot_id == snapshot.id)
+    ).all())
+    actual = _sum_deltas(_balance_deltas(
+        group_id, upto=(snapshot.last_expense_id, snapshot.last_settlement_id)
+    ))
+
+    drift = {
+        uid: (stored.get(uid, 0), actual.get(uid, 0))
+        for uid in set(stored) | set(actual)
+        if stored.get(uid, 0) != actual.get(uid, 0)
+    }
+    if drift:
+        delete_balance_snapshots(group_id)
+    return drift
+
+
+def snapshot_due_groups(min_writes):
+    """Live groups without a ledger and with at least `min_writes` version bumps since their latest snapshot.
+
+    Once a group has group_balances rows its snapshots are never read.
+    """
+    taken = (
+        select(BalanceSnapshot.group_id, func.max(BalanceSnapshot.group_version).label("version"))
+        .group_by(BalanceSnapshot.group_id)
+        .subquery()
+    )
+    return db.session.execute(
+        select(Group.id)
+        .outerjoin(taken, taken.c.group_id == Group.id)
+        .where(
+            Group.deleted_at.is_(None),
+            ~select(GroupBalance.user_id).where(GroupBalance.group_id == Group.id).exists(),
+            Group.version - func.coalesce(taken.c.version, 0) >= min_writes,
+        )
+        .order_by(Group.id)
+    ).scalars().all()
+
+
+def _delete_snapshots(condition, conn=None):
+    execute = conn.execute if conn is not None else db.session.execute
+    doomed = select(BalanceSnapshot.id).where(condition)
+    execute(delete(BalanceSnapshotEntry).where(BalanceSnapshotEntry.snapshot_id.in_(doomed)))
+    execute(delete(BalanceSnapshot).where(BalanceSnapshot.id.in_(doomed)))
+
+
+def delete_balance_snapshots(group_id):
+    _delete_snapshots(BalanceSnapshot.group_id == group_id)
+
+
+# Deleting or changing a row below a watermark makes the snapshots that
+# include it wrong. ORM deletes and updates are caught here; code that
+# rewrites history with bulk statements must call delete_balance_snapshots.
+
+def _invalidate_expense(conn, group_id, expense_id):
+    _delete_snapshots(
+        (BalanceSnapshot.group_id == group_id) & (BalanceSnapshot.last_expense_id >= expense_id), conn
+    )
+
+
+@event.listens_for(Expense, "after_delete")
+def _expense_deleted(mapper, connection, target):
+    _invalidate_expense(connection, target.group_id, target.id)
+
+
+@event.listens_for(Expense, "after_update")
+def _expense_changed(mapper, connection, target):
+    state = db.inspect(target)
+    if any(state.attrs[attr].history.has_changes() for attr in ("amount_cents", "paid_by", "member_set_id")):
+        _invalidate_expense(connection, target.group_id, target.id)
+
+
+@event.listens_for(ExpenseSplit, "after_delete")
+@event.listens_for(ExpenseSplit, "after_update")
+def _split_changed(mapper, connection, target):
+    group_id = connection.execute(select(Expense.group_id).where(Expense.id == target.expense_id)).scalar()
+    if group_id is not None:
+        _invalidate_expense(connection, group_id, target.expense_id)
+
+
+@event.listens_for(Settlement, "after_delete")
+@event.listens_for(Settlement, "after_update")
+def _settlement_changed(mapper, connection, target):
+    _delete_snapshots(
+        (BalanceSnapshot.group_id == target.group_id) & (BalanceSnapshot.last_settlement_id >= target.id),
+        connection
+    )
@@ -0,0 +1,152 @@
+"""Seeded synthetic data for the models.py schema.
+
+The shape scales with the number of expenses:
+
+* users: n / 100, between 8 and 2000
+* groups of 8 members, with user 1 (the benchmark login) in every group
+* half of all expenses land in group 1, the "big group" scenarios target;
+  the rest are spread over the other groups
+* each expense is split evenly between 2-4 members of its group; most
+  point at a shared member set, as the write routes store them, and one
+  in five keeps a split row per user, like data from before member sets
+* one settlement per 10 expenses
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from models import db, User, Group, GroupMember, Expense, ExpenseSplit, Settlement
+from balances import rebuild_ledger
+from member_sets import member_set_id
+from money import split_evenly
+
+PASSWORD = "benchmark"
+GROUP_SIZE = 8
+INSERT_BATCH_SIZE = 5000
+BIG_GROUP_ID = 1
+# Share of even splits stored as one split row per user instead of a member set
+SPLIT_ROWS_SHARE = 0.2
+
+
+def _stream_insert(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+def generate(expenses, seed=0):
+    """Fill the current database with `expenses` expenses and related rows.
+
+    Must run inside an app context on an empty schema. Returns a summary
+    of what was created.
+    """
+    rng = random.Random(seed)
+    users = max(GROUP_SIZE, min(2000, expenses // 100))
+    groups = max(1, users // GROUP_SIZE)
+    settlements = expenses // 10
+    start = datetime(2024, 1, 1)
+
+    password = generate_password_hash(PASSWORD)
+    _stream_insert(User, [
+        {
+            "id": uid,
+            "name": f"User {uid}",
+            "email": f"user{uid}@bench.local",
+            "password": password,
+            "role": "admin" if uid == 1 else "user",
+        }
+        for uid in range(1, users + 1)
+    ])
+
+    members = {}
+    pool = list(range(2, users + 1))
+    for gid in range(1, groups + 1):
+        members[gid] = [1] + rng.sample(pool, min(GROUP_SIZE - 1, len(pool)))
+
+    _stream_insert(Group, [
+        {"id": gid, "name": f"Group {gid}", "created_by": 1}
+        for gid in members
+    ])
+    _stream_insert(GroupMember, [
+        {"group_id": gid, "user_id": uid}
+        for gid, uids in members.items()
+        for uid in uids
+    ])
+
+    def pick_group():
+        if groups == 1 or rng.random() < 0.5:
+            return BIG_GROUP_ID
+        return rng.randint(2, groups)
+
+    expense_batch = []
+    split_batch = []
+    known_sets = {}  # everything below commits once, at the end
+
+    def flush():
+        db.session.execute(insert(Expense), expense_batch)
+        if split_batch:
+            db.session.execute(insert(ExpenseSplit), split_batch)
+        expense_batch.clear()
+        split_batch.clear()
+
+    for n in range(1, expenses + 1):
+        gid = pick_group()
+        amount = rng.randint(100, 50000)
+        paid_by = rng.choice(members[gid])
+        owers = sorted(rng.sample(members[gid], rng.randint(2, min(4, len(members[gid])))))
+        split_rows = rng.random() < SPLIT_ROWS_SHARE
+
+        expense_batch.append({
+            "id": n,
+            "group_id": gid,
+            "amount_cents": amount,
+            "description": f"Expense {n}",
+            "paid_by": paid_by,
+            "created_at": start + timedelta(minutes=n),
+            "member_set_id": None if split_rows else member_set_id(gid, owers, known_sets),
+        })
+
+        if split_rows:
+            for uid, cents in zip(owers, split_evenly(amount, len(owers))):
+                split_batch.append({"expense_id": n, "user_id": uid, "amount_owed_cents": cents})
+
+        if len(expense_batch) >= INSERT_BATCH_SIZE:
+            flush()
+
+    if expense_batch:
+        flush()
+
+    def settlement_rows():
+        for n in range(1, settlements + 1):
+            gid = pick_group()
+            payer, receiver = rng.sample(members[gid], 2)
+            yield {
+                "group_id": gid,
+                "payer_id": payer,
+                "receiver_id": receiver,
+                "amount_cents": rng.randint(100, 20000),
+                "created_at": start + timedelta(minutes=n * 10),
+            }
+
+    _stream_insert(Settlement, settlement_rows())
+
+    for gid in members:
+        rebuild_ledger(gid)
+
+    db.session.commit()
+
+    return {
+        "users": users,
+        "groups": groups,
+        "expenses": expenses,
+        "settlements": settlements,
+        "big_group_id": BIG_GROUP_ID,
+        "login_email": "user1@bench.local",
+        "login_password": PASSWORD,
+    }
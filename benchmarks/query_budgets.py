@@ -0,0 +1,195 @@
+"""SQL query count of every route in app.py at two data sizes.
+
+    python -m benchmarks.query_budgets [--sizes 50 5000]
+
+Runs one scripted session against each size and prints the count per
+route. Exits with status 1 if a count differs between the sizes, which
+means an N+1 loop. The budgets themselves are pinned by
+tests/test_query_budgets.py, which runs the same session.
+"""
+import argparse
+import sys
+
+from benchmarks.run import configure_database
+
+
+def _session_steps(client, summary):
+    """Yield (endpoint, method, callable) for one pass over every route.
+
+    Code between the yields runs outside the measured budget.
+    """
+    from jobs import wait_for_jobs
+
+    big = summary["big_group_id"]
+    peer = summary["peer_ids"][0]
+    # Five ways: generated expenses split 2-4 ways, so the member set is always new
+    split_five = {str(uid): 2 for uid in [1, *summary["peer_ids"][:4]]}
+    login = {"email": summary["login_email"], "password": summary["login_password"]}
+    state = {}
+
+    def new_user():
+        response = client.post("/api/auth/register", json={
+            "name": "Budget User", "email": f"budget{len(state)}@bench.local", "password": "pw"
+        })
+        state[f"user{len(state)}"] = response.get_json()["id"]
+        return response
+
+    def queue_job(key, post):
+        def step():
+            response = post()
+            state[key] = response.get_json()["job_id"]
+            return response
+        return step
+
+    def create_group():
+        response = client.post("/api/groups", json={
+            "name": "Budget Group", "creator_id": 1, "member_ids": [1, 2]
+        })
+        state["group"] = response.get_json()["group_id"]
+        return response
+
+    ndjson = "".join(f'{{"amount": {n + 1}, "paid_by": 1}}\n' for n in range(10))
+
+    yield "register", "POST", new_user
+    yield "register_page", "GET", lambda: client.get("/register")
+    yield "register_page", "POST", lambda: client.post("/register", data={
+        "name": "Form User", "email": "budget-form@bench.local", "password": "pw"
+    })
+    yield "login", "POST", lambda: client.post("/api/auth/login", json=login)
+    yield "login_page", "GET", lambda: client.get("/login")
+    yield "login_page", "POST", lambda: client.post("/login", data=login)
+    yield "index", "GET", lambda: client.get("/")
+    yield "all_users", "GET", lambda: client.get("/api/users")
+    yield "create_group", "POST", create_group
+    yield "user_groups", "GET", lambda: client.get("/api/groups/1")
+    yield "user_summary", "GET", lambda: client.get("/api/users/1/summary")
+    yield "group_members", "GET", lambda: client.get(f"/api/groups/{big}/members")
+    yield "add_expense", "POST", lambda: client.post("/api/expenses", json={
+        "group_id": big, "amount": 10, "paid_by": 1, "splits": split_five
+    })
+    yield "list_expenses", "GET", lambda: client.get(f"/api/expenses/{big}")
+    yield "balances", "GET", lambda: client.get(f"/api/balances/{big}")
+    # A poll with the ETag of the previous (unmeasured) response gets a 304
+    etag = client.get(f"/api/balances/{big}").headers["ETag"]
+    yield "balances", "GET", lambda: client.get(f"/api/balances/{big}", headers={"If-None-Match": etag})
+    yield "add_settlement", "POST", lambda: client.post("/api/settlements", json={
+        "group_id": big, "payer_id": peer, "receiver_id": 1, "amount": 3
+    })
+    yield "list_settlements", "GET", lambda: client.get(f"/api/settlements/{big}")
+    yield "import_group_expenses", "POST", lambda: client.post(
+        f"/api/groups/{big}/import", data=ndjson, content_type="application/x-ndjson"
+    )
+    yield "import_group_expenses", "POST", queue_job("import_job", lambda: client.post(
+        f"/api/groups/{big}/import", data=ndjson, content_type="application/x-ndjson",
+        headers={"Prefer": "respond-async"}
+    ))
+    yield "export_group", "GET", lambda: client.get(f"/api/groups/{state['group']}/export")
+    yield "export_group", "GET", queue_job("export_job", lambda: client.get(
+        f"/api/groups/{state['group']}/export", headers={"Prefer": "respond-async"}
+    ))
+    yield "rebuild_group_balances", "POST", lambda: client.post(f"/api/groups/{big}/rebuild-balances")
+    wait_for_jobs(timeout=30)
+    yield "job_status", "GET", lambda: client.get(f"/api/jobs/{state['import_job']}")
+    yield "list_jobs", "GET", lambda: client.get("/api/jobs")
+    yield "download_job_file", "GET", lambda: client.get(f"/api/jobs/{state['export_job']}/download")
+    def open_event_stream():
+        # Read the first chunk and hang up; the stream itself never ends
+        response = client.get(f"/api/groups/{big}/events", buffered=False)
+        next(iter(response.response))
+        response.close()
+        return response
+
+    yield "group_events_feed", "GET", open_event_stream
+    yield "sync", "GET", lambda: client.get("/api/sync")
+    # Nothing held back, so the page carries every entity type this session wrote
+    client.application.config["SYNC_SETTLE_SECONDS"] = 0
+    yield "sync", "GET", lambda: client.get("/api/sync?since=0")
+    yield "dashboard", "GET", lambda: client.get("/dashboard")
+    yield "new_group", "GET", lambda: client.get("/groups/new")
+    yield "new_group", "POST", lambda: client.post("/groups/new", data={"name": "Form Group", "members": ["2"]})
+    yield "add_members", "GET", lambda: client.get(f"/groups/{big}/members")
+    yield "add_members", "POST", lambda: client.post(
+        f"/groups/{big}/members", data={"members": [str(state["user0"])]}
+    )
+    yield "group_page", "GET", lambda: client.get(f"/groups/{big}")
+    yield "add_expense_form", "POST", lambda: client.post("/expenses/add", data={
+        "group_id": big, "amount": "12.50", "paid_by": 1, "description": "budget"
+    })
+    yield "add_settlement_form", "POST", lambda: client.post("/settlements/add", data={
+        "group_id": big, "payer_id": peer, "receiver_id": 1, "amount": "1"
+    })
+    yield "create_user", "GET", lambda: client.get("/admin/create-user")
+    yield "create_user", "POST", lambda: client.post("/admin/create-user", data={
+        "name": "Admin Made", "email": "budget-admin@bench.local", "password": "pw"
+    })
+    yield "metrics", "GET", lambda: client.get("/metrics")
+    yield "delete_group", "POST", lambda: client.post(f"/groups/{state['group']}/delete")
+    yield "logout", "GET", lambda: client.get("/logout")
+
+
+def measure_routes(app, expenses):
+    """Query count per (endpoint, method) for one session on fresh data."""
+    import app as app_module
+    from benchmarks.generate import generate
+    from group_cache import clear_view_cache
+    from jobs import wait_for_jobs
+    from migrations import upgrade_schema
+    from models import db, GroupMember
+    from query_budget import QueryBudget
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        upgrade_schema()
+        summary = generate(expenses)
+        summary["peer_ids"] = db.session.execute(
+            db.select(GroupMember.user_id)
+            .where(GroupMember.group_id == summary["big_group_id"], GroupMember.user_id != 1)
+            .order_by(GroupMember.user_id)
+        ).scalars().all()
+
+    # Cached views of the previous size would otherwise match the new ids
+    clear_view_cache()
+    app_module._user_names.clear()
+
+    client = app.test_client()
+    client.post("/login", data={"email": summary["login_email"], "password": summary["login_password"]})
+
+    counts = {}
+    for endpoint, method, step in _session_steps(client, summary):
+        with QueryBudget(float("inf")) as budget:
+            response = step()
+            response.get_data()  # drain streamed bodies inside the budget
+        if response.status_code >= 500:
+            raise RuntimeError(f"{method} {endpoint} failed with {response.status_code}")
+        # Routes exercised more than once (e.g. with Prefer: respond-async) keep their maximum
+        counts[(endpoint, method)] = max(counts.get((endpoint, method), 0), budget.count)
+
+    # delete_group queues a purge job; let it finish before the next size
+    wait_for_jobs(timeout=60)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs=2, default=[50, 5000])
+    args = parser.parse_args(argv)
+
+    configure_database()
+    from app import app
+
+    small, large = (measure_routes(app, size) for size in args.sizes)
+
+    grew = False
+    for key in sorted(set(small) | set(large)):
+        endpoint, method = key
+        a, b = small.get(key), large.get(key)
+        print(f"{method:5} {endpoint:24} {args.sizes[0]}={a} {args.sizes[1]}={b}")
+        if a != b:
+            grew = True
+            print(f"FAIL: {method} {endpoint} query count grows with data: {a} -> {b}", file=sys.stderr)
+    sys.exit(1 if grew else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Measure balance, settlement and page costs as group history grows.
+
+    python -m benchmarks.run [--sizes 10 1000 100000 1000000] [--repeat 5] [--output FILE]
+
+Each size gets a fresh SQLite database filled by benchmarks.generate.
+Every scenario reports wall time, SQL statement count and peak Python
+memory. Results are printed (or written) as one JSON document tagged with
+the git commit, so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = [10, 1000, 100000, 1000000]
+
+
+def configure_database():
+    """Point app.py at a scratch SQLite file and job files directory; must run before importing it."""
+    directory = tempfile.mkdtemp(prefix="ledger-bench-")
+    path = os.path.join(directory, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["JOB_FILES_DIR"] = os.path.join(directory, "job-files")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    return path
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    """Counts statements sent through an engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def measure(fn, counter, repeat):
+    timings = []
+    queries = 0
+    peak = 0
+
+    for _ in range(repeat):
+        counter.count = 0
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        queries = counter.count
+
+    return {
+        "wall_ms_min": round(min(timings) * 1000, 3),
+        "wall_ms_median": round(statistics.median(timings) * 1000, 3),
+        "queries": queries,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_size(app, counter, expenses, repeat, seed):
+    import app as app_module
+    import solver
+    from benchmarks.generate import generate
+    from balances import calculate_balances, compute_balances, take_balance_snapshot
+    from group_cache import clear_view_cache
+    from migrations import upgrade_schema
+    from models import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        upgrade_schema()
+
+        start = time.perf_counter()
+        summary = generate(expenses, seed=seed)
+        summary["generate_s"] = round(time.perf_counter() - start, 2)
+
+        # compute_balances_snapshot reads this; compute_balances_full ignores it
+        take_balance_snapshot(summary["big_group_id"])
+        db.session.commit()
+
+    client = app.test_client()
+    client.post("/login", data={"email": summary["login_email"], "password": summary["login_password"]})
+    big = summary["big_group_id"]
+
+    def in_context(fn):
+        def wrapped():
+            with app.app_context():
+                fn()
+        return wrapped
+
+    def cold(fn):
+        def wrapped():
+            clear_view_cache()
+            app_module._user_names.clear()
+            solver._solutions.clear()
+            fn()
+        return wrapped
+
+    def get(url):
+        def wrapped():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return wrapped
+
+    scenarios = {
+        "calculate_balances": in_context(lambda: calculate_balances(big)),
+        "compute_balances_full": in_context(lambda: compute_balances(big, full=True)),
+        "compute_balances_snapshot": in_context(lambda: compute_balances(big)),
+        "suggest_settlements": cold(in_context(lambda: app_module.suggest_settlements(big))),
+        "group_page_cold": cold(get(f"/groups/{big}")),
+        "group_page_warm": get(f"/groups/{big}"),
+        "dashboard": get("/dashboard"),
+        # User 1 is in every group
+        "api_user_summary": get("/api/users/1/summary"),
+        "api_balances_cold": cold(get(f"/api/balances/{big}")),
+        "api_expenses_first_page": get(f"/api/expenses/{big}"),
+    }
+
+    results = {}
+    for name, fn in scenarios.items():
+        fn()  # warm-up: imports, template compilation, SQLite page cache
+        results[name] = measure(fn, counter, repeat)
+
+    return {"data": summary, "scenarios": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Numbers of expenses to benchmark.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    configure_database()
+    from app import app
+    from models import db
+
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+
+    report = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "sizes": {},
+    }
+    for size in args.sizes:
+        report["sizes"][str(size)] = run_size(app, counter, size, args.repeat, args.seed)
+        print(f"benchmarked {size} expenses", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compare settlement solvers on synthetic balance vectors.
+
+    python -m benchmarks.solver [--sizes 10 100 1000] [--seed 7]
+
+Prints one JSON object per (size, solver) with the number of transfers and
+the solve time.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from solver import SOLVERS  # noqa: E402
+
+
+def clustered_balances(members, rng):
+    """Balances made of small zero-sum circles of friends, in shuffled order.
+
+    Real groups tend to contain sub-groups that only owe each other, which
+    is where a minimum-transfer solver beats greedy matching.
+    """
+    balances = {}
+    user_ids = list(range(1, members + 1))
+    rng.shuffle(user_ids)
+
+    pos = 0
+    while pos < len(user_ids):
+        size = min(rng.choice((2, 3, 3, 4)), len(user_ids) - pos)
+        circle = user_ids[pos:pos + size]
+        pos += size
+
+        if size == 1:
+            balances[circle[0]] = 0
+            continue
+
+        amounts = [rng.randint(1, 40) * 500 for _ in circle[:-1]]
+        for uid, amt in zip(circle, amounts):
+            balances[uid] = amt if rng.random() < 0.5 else -amt
+        balances[circle[-1]] = -sum(balances[uid] for uid in circle[:-1])
+
+    return balances
+
+
+def check_settles(balances, transfers):
+    remaining = dict(balances)
+    for debtor, creditor, cents in transfers:
+        remaining[debtor] += cents
+        remaining[creditor] -= cents
+    return all(v == 0 for v in remaining.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        balances = clustered_balances(size, random.Random(args.seed + size))
+
+        for name, solve in SOLVERS.items():
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                transfers = solve(balances)
+                timings.append(time.perf_counter() - start)
+
+            print(json.dumps({
+                "members": size,
+                "solver": name,
+                "transfers": len(transfers),
+                "settles": check_settles(balances, transfers),
+                "best_ms": round(min(timings) * 1000, 3),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# change_log.py
+from datetime import timedelta
+from sqlalchemy import and_, event, func, insert, literal, or_, select
+from models import db, User, Group, GroupMember, Expense, ExpenseSplit, Settlement, Change
+from db_routing import RoutingSession
+from member_sets import compact_splits
+from money import from_cents
+
+ENTITIES = ("group", "membership", "expense", "settlement")
+
+DEFAULT_SETTLE_SECONDS = 2.0
+
+
+class CursorExpired(LookupError):
+    """The changes after a cursor have been pruned; the client must reload everything."""
+
+
+def _db_now(minus_seconds=0):
+    """The database's current UTC time, less `minus_seconds`, as a SQL expression.
+
+    Changes are stamped and compared on this one clock, so app servers
+    whose clocks drift apart cannot make a change look settled early.
+    """
+    if db.engine.dialect.name == "sqlite":
+        return func.strftime("%Y-%m-%d %H:%M:%f", "now", f"-{minus_seconds} seconds")
+    return func.timezone("utc", func.clock_timestamp()) - timedelta(seconds=minus_seconds)
+
+
+# --------------------------------------------------
+# RECORDING
+# --------------------------------------------------
+
+def record_change(group_id, entity, entity_id, op="upsert", user_id=None):
+    """Log a change in the current transaction.
+
+    Rows are queued and written as one INSERT just before the commit, so
+    a change's id is assigned as late as possible. Memberships use the
+    member's user id as entity_id; splits travel with their expense.
+    """
+    db.session.info.setdefault("changes", []).append({
+        "group_id": group_id, "user_id": user_id, "entity": entity, "entity_id": entity_id, "op": op,
+    })
+
+
+def record_group_deleted(group_id):
+    """Log a group deletion once per member.
+
+    The rows name their user, so they still reach the members' devices
+    after the purge has removed the memberships.
+    """
+    for member_id in db.session.execute(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+    ).scalars():
+        record_change(group_id, "group", group_id, op="delete", user_id=member_id)
+
+
+def record_member_renamed(connection, user_id):
+    """Log a membership change in every group of `user_id`, in one INSERT ... SELECT.
+
+    For mapper events, which run mid-flush on `connection`.
+    """
+    connection.execute(
+        insert(Change).from_select(
+            ["group_id", "entity", "entity_id", "op", "created_at"],
+            select(GroupMember.group_id, literal("membership"), GroupMember.user_id,
+                   literal("upsert"), _db_now())
+            .where(GroupMember.user_id == user_id)
+        )
+    )
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def _write_changes(db_session):
+    rows = db_session.info.pop("changes", None)
+    if rows:
+        db_session.execute(insert(Change).values(created_at=_db_now()), rows)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_changes(db_session):
+    db_session.info.pop("changes", None)
+
+
+# --------------------------------------------------
+# SYNC
+# --------------------------------------------------
+
+def _first_unsettled(since, settle_seconds):
+    """Lowest change id after `since` younger than `settle_seconds` (NULL if none), as a subquery."""
+    return (
+        select(func.min(Change.id))
+        .where(Change.id > since, Change.created_at > _db_now(settle_seconds))
+        .scalar_subquery()
+    )
+
+
+def head_cursor(settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """The cursor to start syncing from after loading current state.
+
+    It stops before the oldest unsettled change, so nothing at or below it
+    can still be in flight.
+    """
+    return db.session.execute(
+        select(func.coalesce(
+            _first_unsettled(0, settle_seconds) - 1,
+            select(func.max(Change.id)).scalar_subquery(),
+            0,
+        ))
+    ).scalar()
+
+
+def sync_page(user_id, since, limit, settle_seconds=DEFAULT_SETTLE_SECONDS):
+    """Changes visible to `user_id` after cursor `since`, oldest first.
+
+    Returns (changes, next_cursor, has_more). Each change carries the
+    entity's current state, or op "delete" if it no longer exists; an
+    entity changed several times in the page appears once, at its last
+    change. A page ends before the first change younger than
+    `settle_seconds`, whoever it belongs to: a transaction that committed
+    after a later-numbered one is delivered before the cursor passes it.
+    Runs a fixed number of queries per page.
+    """
+    oldest = db.session.execute(select(func.min(Change.id))).scalar()
+    if oldest is not None and since < oldest - 1:
+        raise CursorExpired(since)
+
+    stop = _first_unsettled(since, settle_seconds)
+    member_of = select(GroupMember.group_id).where(GroupMember.user_id == user_id)
+    rows = db.session.execute(
+        select(Change)
+        .where(
+            Change.id > since,
+            or_(stop.is_(None), Change.id < stop),
+            or_(
+                Change.user_id == user_id,
+                and_(Change.user_id.is_(None), Change.group_id.in_(member_of)),
+            )
+        )
+        .order_by(Change.id)
+        .limit(limit + 1)
+    ).scalars().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = rows[-1].id if rows else since
+
+    latest = {}
+    for change in rows:
+        latest[(change.entity, change.group_id, change.entity_id)] = change
+    changes = sorted(latest.values(), key=lambda c: c.id)
+
+    states = _load_states(changes)
+    result = []
+    for change in changes:
+        data = states.get((change.entity, change.group_id, change.entity_id))
+        result.append({
+            "seq": change.id,
+            "entity": change.entity,
+            "id": change.entity_id,
+            "group_id": change.group_id,
+            "op": "upsert" if change.op == "upsert" and data is not None else "delete",
+            "data": data if change.op == "upsert" else None,
+        })
+
+    return result, next_cursor, has_more
+
+
+def _load_states(changes):
+    """Current state of every upserted entity in `changes`, one query per entity type."""
+    wanted = {entity: set() for entity in ENTITIES}
+    for change in changes:
+        if change.op == "upsert":
+            wanted[change.entity].add((change.group_id, change.entity_id))
+
+    states = {}
+
+    if wanted["group"]:
+        for group in db.session.execute(
+            select(Group).where(Group.id.in_([gid for gid, _ in wanted["group"]]), Group.deleted_at.is_(None))
+        ).scalars():
+            states[("group", group.id, group.id)] = {"name": group.name, "created_by": group.created_by}
+
+    if wanted["membership"]:
+        pairs = wanted["membership"]
+        for group_id, member_id, name in db.session.execute(
+            select(GroupMember.group_id, GroupMember.user_id, User.name)
+            .join(User, User.id == GroupMember.user_id)
+            .where(GroupMember.group_id.in_({gid for gid, _ in pairs}),
+                   GroupMember.user_id.in_({uid for _, uid in pairs}))
+        ):
+            if (group_id, member_id) in pairs:
+                states[("membership", group_id, member_id)] = {"user_id": member_id, "name": name}
+
+    if wanted["expense"]:
+        ids = [eid for _, eid in wanted["expense"]]
+        splits = {}
+        for expense_id, split_user, owed in db.session.execute(
+            select(ExpenseSplit.expense_id, ExpenseSplit.user_id, ExpenseSplit.amount_owed_cents)
+            .where(ExpenseSplit.expense_id.in_(ids))
+            .union_all(compact_splits(Expense.id.in_(ids)))
+        ):
+            splits.setdefault(expense_id, []).append({"user_id": split_user, "amount": from_cents(owed)})
+
+        for e in db.session.execute(select(Expense).where(Expense.id.in_(ids))).scalars():
+            states[("expense", e.group_id, e.id)] = {
+                "amount": from_cents(e.amount_cents),
+                "paid_by": e.paid_by,
+                "description": e.description,
+                "created_at": e.created_at.isoformat(),
+                "splits": splits.get(e.id, []),
+            }
+
+    if wanted["settlement"]:
+        for s in db.session.execute(
+            select(Settlement).where(Settlement.id.in_([sid for _, sid in wanted["settlement"]]))
+        ).scalars():
+            states[("settlement", s.group_id, s.id)] = {
+                "amount": from_cents(s.amount_cents),
+                "payer_id": s.payer_id,
+                "receiver_id": s.receiver_id,
+                "created_at": s.created_at.isoformat(),
+            }
+
+    return states
@@ -0,0 +1,52 @@
+# conditional.py
+from functools import wraps
+from flask import Response, jsonify, make_response, request
+from werkzeug.http import is_resource_modified
+from group_cache import group_marker
+
+
+def not_modified(etag):
+    """True if the request's If-None-Match still matches `etag`.
+
+    If-Modified-Since is ignored: HTTP dates have one-second resolution,
+    so a write in the same second as the last response would get a 304.
+    """
+    return not is_resource_modified(request.environ, etag=etag)
+
+
+def set_validators(response, etag, weak=False):
+    response.set_etag(etag, weak=weak)
+    # Let clients keep the body but ask every time
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional_group_get(kind):
+    """Serve a group endpoint with an ETag from the group's version.
+
+    Only the groups row is read before deciding: a matching If-None-Match
+    gets 304 without running the view. Otherwise the view is called as
+    view(group_id, version, ...) and its 200 responses carry the ETag.
+    Missing or deleted groups get 404.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(group_id, **kwargs):
+            try:
+                marker = group_marker(group_id)
+            except Exception as e:
+                return jsonify({"error": "Failed to fetch group"}), 500
+            if marker is None:
+                return jsonify({"error": "Group not found"}), 404
+
+            version, _ = marker
+            etag = f"{kind}-{group_id}-{version}"
+            if not_modified(etag):
+                return set_validators(Response(status=304), etag)
+
+            response = make_response(view(group_id, version, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,117 @@
+# db_routing.py
+import os
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = "replica"
+
+# HTML pages that only read; every GET under /api/ is treated the same way
+READ_ONLY_ENDPOINTS = {"group_page", "dashboard"}
+
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+
+
+def engine_options(uri, env=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS from DB_* environment variables.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE
+    are passed to the pool when set; DB_POOL_PRE_PING (default on) checks
+    connections before use; DB_STATEMENT_TIMEOUT_MS sets PostgreSQL's
+    statement_timeout on every connection.
+    """
+    options = {"pool_pre_ping": env.get("DB_POOL_PRE_PING", "1") not in ("0", "false", "no")}
+
+    for option, name, cast in [
+        ("pool_size", "DB_POOL_SIZE", int),
+        ("max_overflow", "DB_MAX_OVERFLOW", int),
+        ("pool_timeout", "DB_POOL_TIMEOUT", float),
+        ("pool_recycle", "DB_POOL_RECYCLE", int),
+    ]:
+        if env.get(name):
+            options[option] = cast(env[name])
+
+    timeout = env.get("DB_STATEMENT_TIMEOUT_MS")
+    if timeout and uri and uri.startswith("postgresql"):
+        options["connect_args"] = {"options": f"-c statement_timeout={int(timeout)}"}
+
+    return options
+
+
+class RoutingSession(Session):
+    """Sends SELECTs of read-only requests to the replica bind, everything else to the primary.
+
+    Flushes, INSERT/UPDATE/DELETE and raw SQL always use the primary, and
+    once a request has flushed a write its SELECTs do too, so a GET that
+    writes (e.g. queueing an export job) reads back what it wrote.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and isinstance(clause, Select)
+            and not self._flushing
+            and has_request_context()
+            and g.get("use_replica")
+            and not g.get("db_flushed")
+        ):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _stick_to_primary():
+    if has_request_context():
+        g.db_flushed = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _flushed(db_session, flush_context):
+    _stick_to_primary()
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _executed_write(orm_execute_state):
+    # insert()/update()/delete() run through the session skip the flush
+    if not orm_execute_state.is_select:
+        _stick_to_primary()
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(db_session):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _read_only_request():
+    if request.method not in ("GET", "HEAD"):
+        return False
+    return request.endpoint in READ_ONLY_ENDPOINTS or request.path.startswith("/api/")
+
+
+def init_read_routing(app):
+    """Route read-only requests to DATABASE_REPLICA_URL when one is configured.
+
+    A client whose request committed anything reads from the primary for
+    the next REPLICA_READ_YOUR_WRITES_SECONDS, so the page it is redirected
+    to shows its own write despite replica lag.
+    """
+    if REPLICA_BIND not in (app.config.get("SQLALCHEMY_BINDS") or {}):
+        return
+
+    window = app.config.get("REPLICA_READ_YOUR_WRITES_SECONDS", DEFAULT_READ_YOUR_WRITES_SECONDS)
+
+    @app.before_request
+    def choose_read_bind():
+        recent_write = time.time() - session.get("db_wrote_at", 0) < window
+        g.use_replica = _read_only_request() and not recent_write
+
+    @app.after_request
+    def stamp_write(response):
+        if g.get("db_wrote"):
+            session["db_wrote_at"] = time.time()
+        return response
@@ -0,0 +1,138 @@
+# expenses.py
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, select
+from models import db, GroupMember, Expense, ExpenseSplit
+from balances import apply_balance_deltas
+from change_log import record_change
+from group_cache import bump_group_version
+from group_events import queue_group_event
+from member_sets import can_compact, member_set_id
+from money import to_cents, from_cents, allocate, split_evenly
+
+SPLIT_TYPES = ("equal", "shares", "percentage", "exact")
+
+
+class SplitError(ValueError):
+    pass
+
+
+def _user_values(values):
+    try:
+        return {int(uid): value for uid, value in values.items()}
+    except (AttributeError, TypeError, ValueError):
+        raise SplitError("splits must map user ids to values")
+
+
+def _weight(value):
+    try:
+        weight = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise SplitError(f"invalid split value: {value!r}")
+    if not weight.is_finite() or weight < 0:
+        raise SplitError(f"invalid split value: {value!r}")
+    return weight
+
+
+def compute_splits(amount_cents, split_type, members, values=None):
+    """Cents owed per user for an expense of `amount_cents`.
+
+    equal       values: optional list of participating user ids (default: all members)
+    shares      values: {user_id: weight}
+    percentage  values: {user_id: percent}, adding up to 100
+    exact       values: {user_id: amount}, adding up to the expense amount
+
+    Shares and percentages are allocated by largest remainder, so the
+    result always adds up to amount_cents. Users owing nothing are left out.
+    """
+    if split_type not in SPLIT_TYPES:
+        raise SplitError(f"split_type must be one of {', '.join(SPLIT_TYPES)}")
+
+    if split_type == "equal":
+        try:
+            users = sorted({int(uid) for uid in values}) if values else sorted(members)
+        except (TypeError, ValueError):
+            raise SplitError("equal splits take a list of user ids")
+        owed = dict(zip(users, split_evenly(amount_cents, len(users)))) if users else {}
+    else:
+        if not values:
+            raise SplitError(f"{split_type} splits need a value per user")
+        values = _user_values(values)
+        users = sorted(values)
+
+        if split_type == "exact":
+            try:
+                owed = {uid: to_cents(values[uid]) for uid in users}
+            except ValueError as e:
+                raise SplitError(str(e))
+            if any(cents < 0 for cents in owed.values()):
+                raise SplitError("split amounts cannot be negative")
+            if sum(owed.values()) != amount_cents:
+                raise SplitError("Splits must add up to the expense amount")
+        else:
+            weights = [_weight(values[uid]) for uid in users]
+            if split_type == "percentage" and sum(weights) != 100:
+                raise SplitError("Percentages must add up to 100")
+            if not sum(weights):
+                raise SplitError("At least one share must be positive")
+            owed = dict(zip(users, allocate(amount_cents, weights)))
+
+    outsiders = set(owed) - set(members)
+    if outsiders:
+        raise SplitError(f"Users {sorted(outsiders)} are not group members")
+    if not owed:
+        raise SplitError("An expense needs at least one participant")
+
+    return {uid: cents for uid, cents in owed.items() if cents}
+
+
+def record_expense(group_id, paid_by, amount_cents, split_type="equal", values=None,
+                   description=None):
+    """Validate and write one expense with its splits and ledger changes.
+
+    The expense row, its splits (one multi-row INSERT, or a member set
+    reference for even splits) and the ledger update share a single
+    transaction, committed here, which also publishes an "expense" group
+    event and logs the change for sync; on SplitError nothing is written.
+    Returns the new expense id.
+    """
+    if amount_cents <= 0:
+        raise SplitError("Amount must be greater than zero")
+
+    members = set(db.session.execute(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+    ).scalars())
+
+    if not members:
+        raise SplitError("No members in group")
+    if paid_by not in members:
+        raise SplitError(f"Payer {paid_by} is not a group member")
+
+    splits = compute_splits(amount_cents, split_type, members, values)
+
+    # Even splits are stored as a reference to a member set instead of split rows
+    set_id = member_set_id(group_id, splits) if can_compact(amount_cents, splits) else None
+
+    bump_group_version(group_id)
+
+    expense_id = db.session.execute(
+        insert(Expense)
+        .values(group_id=group_id, amount_cents=amount_cents, paid_by=paid_by,
+                description=description, member_set_id=set_id)
+        .returning(Expense.id)
+    ).scalar_one()
+
+    if set_id is None:
+        db.session.execute(insert(ExpenseSplit).values([
+            {"expense_id": expense_id, "user_id": uid, "amount_owed_cents": cents}
+            for uid, cents in splits.items()
+        ]))
+
+    apply_balance_deltas(
+        group_id, [(paid_by, amount_cents)] + [(uid, -cents) for uid, cents in splits.items()]
+    )
+    queue_group_event(group_id, "expense", id=expense_id, amount=from_cents(amount_cents),
+                      paid_by=paid_by, description=description)
+    record_change(group_id, "expense", expense_id)
+    db.session.commit()
+
+    return expense_id
@@ -0,0 +1,123 @@
+# group_cache.py
+import importlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from sqlalchemy import select, update
+from cache import LRUCache
+from models import db, Group
+
+
+class CacheBackend(ABC):
+    """Storage for computed group views.
+
+    Keys embed the group version, so entries never need invalidating; a
+    backend only has to store values and may evict them at any time. A
+    backend shared between gunicorn workers (Redis, memcached) must
+    pickle values. Objects that do not subclass this still count as
+    backends if they have all three methods.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        """The stored value, or None."""
+
+    @abstractmethod
+    def set(self, key, value):
+        """Store a value; it may be evicted at any time."""
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry."""
+
+    @classmethod
+    def __subclasshook__(cls, other):
+        if cls is CacheBackend:
+            return all(callable(getattr(other, name, None)) for name in cls.__abstractmethods__)
+        return NotImplemented
+
+
+class InProcessCache(CacheBackend):
+    """Per-process bounded LRU backend."""
+
+    def __init__(self, maxsize=512):
+        self._lru = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self._lru.get(key)
+
+    def set(self, key, value):
+        self._lru.set(key, value)
+
+    def clear(self):
+        self._lru.clear()
+
+
+_backend = InProcessCache()
+
+
+def init_view_cache(app):
+    """Pick the backend from GROUP_VIEW_CACHE_BACKEND ("module:factory") or default to in-process."""
+    global _backend
+
+    spec = app.config.get("GROUP_VIEW_CACHE_BACKEND")
+    if spec:
+        module_name, factory = spec.split(":")
+        backend = getattr(importlib.import_module(module_name), factory)()
+        if not isinstance(backend, CacheBackend):
+            raise TypeError(f"{spec} does not implement get, set and clear")
+        _backend = backend
+    else:
+        _backend = InProcessCache(maxsize=app.config.get("GROUP_VIEW_CACHE_SIZE", 512))
+
+
+def clear_view_cache():
+    _backend.clear()
+
+
+class GroupNotFound(LookupError):
+    pass
+
+
+def bump_group_version(group_id):
+    """Mark a group as changed inside the caller's transaction.
+
+    Call this before inserting the rows of a write: the UPDATE takes the
+    group's row lock, which serializes writers to the same group. Raises
+    GroupNotFound if the group does not exist or has been deleted.
+    Returns the new version, which is also kept in bumped_versions().
+    """
+    version = db.session.execute(
+        update(Group)
+        .where(Group.id == group_id, Group.deleted_at.is_(None))
+        .values(version=Group.version + 1, updated_at=datetime.utcnow())
+        .returning(Group.version)
+    ).scalar()
+    if version is None:
+        raise GroupNotFound(group_id)
+
+    db.session.info.setdefault("group_versions", {})[group_id] = version
+    return version
+
+
+def bumped_versions(db_session):
+    """{group_id: version} for the groups the session's current transaction bumped."""
+    return db_session.info.get("group_versions", {})
+
+
+def group_marker(group_id):
+    """(version, updated_at) of a live group, or None; reads only the groups row."""
+    return db.session.execute(
+        select(Group.version, Group.updated_at).where(Group.id == group_id, Group.deleted_at.is_(None))
+    ).first()
+
+
+def cached_group_view(group_id, version, name, compute, *args):
+    """Return compute(group_id, *args), cached under (name, group_id, version, *args)."""
+    key = (name, group_id, version) + args
+    value = _backend.get(key)
+
+    if value is None:
+        value = compute(group_id, *args)
+        _backend.set(key, value)
+
+    return value
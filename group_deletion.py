@@ -0,0 +1,87 @@
+# group_deletion.py
+from datetime import datetime
+from sqlalchemy import delete, select, update
+from models import db, Group, GroupMember, Expense, ExpenseSplit, Settlement
+from balances import delete_ledger, delete_balance_snapshots
+from member_sets import delete_member_sets
+
+PURGE_BATCH_SIZE = 1000
+
+
+def soft_delete_group(group_id):
+    """Mark a group deleted inside the caller's transaction.
+
+    Every read filters on deleted_at, and bump_group_version refuses to
+    write to a deleted group, so it disappears as soon as this commits.
+    Returns False if the group does not exist or is already deleted.
+    """
+    result = db.session.execute(
+        update(Group)
+        .where(Group.id == group_id, Group.deleted_at.is_(None))
+        .values(deleted_at=datetime.utcnow(), updated_at=datetime.utcnow(), version=Group.version + 1)
+    )
+    return result.rowcount == 1
+
+
+def _delete_in_batches(model, group_id, batch_size, before_delete=None):
+    """Yield the running total of deleted rows after each committed batch."""
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(model.id).where(model.group_id == group_id).order_by(model.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return
+
+        if before_delete:
+            before_delete(ids)
+        db.session.execute(delete(model).where(model.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        yield deleted
+
+
+def purge_group(group_id, batch_size=PURGE_BATCH_SIZE, progress=None):
+    """Delete a soft-deleted group's rows, committing every `batch_size` rows.
+
+    Each batch is its own short transaction, so no lock is held for long.
+    Safe to rerun after an interruption: it continues with whatever rows
+    are left. `progress(table, rows_deleted_so_far)` is called per batch.
+    Returns the number of rows deleted per table.
+    """
+    if db.session.execute(
+        select(Group.deleted_at).where(Group.id == group_id)
+    ).scalar() is None:
+        raise ValueError(f"group {group_id} is not marked deleted")
+
+    def delete_splits(expense_ids):
+        db.session.execute(delete(ExpenseSplit).where(ExpenseSplit.expense_id.in_(expense_ids)))
+
+    counts = {}
+    for table, model, before_delete in [
+        ("expenses", Expense, delete_splits),
+        ("settlements", Settlement, None),
+    ]:
+        counts[table] = 0
+        for deleted in _delete_in_batches(model, group_id, batch_size, before_delete):
+            counts[table] = deleted
+            if progress:
+                progress(table, deleted)
+
+    # Bounded by the membership size; the group row goes last
+    delete_member_sets(group_id)
+    counts["group_members"] = db.session.execute(
+        delete(GroupMember).where(GroupMember.group_id == group_id)
+    ).rowcount
+    delete_ledger(group_id)
+    delete_balance_snapshots(group_id)
+    db.session.execute(delete(Group).where(Group.id == group_id))
+    db.session.commit()
+
+    return counts
+
+
+def deleted_group_ids():
+    return db.session.execute(
+        select(Group.id).where(Group.deleted_at.isnot(None)).order_by(Group.id)
+    ).scalars().all()
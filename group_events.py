@@ -0,0 +1,346 @@
+# group_events.py
+import json
+import logging
+import queue
+import select as selectors
+import threading
+import time
+import uuid
+from collections import defaultdict
+from sqlalchemy import event, func, select
+from models import db, Group
+from db_routing import RoutingSession
+from group_cache import bumped_versions
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "group_events"
+SUBSCRIBER_QUEUE_SIZE = 100
+POLL_BATCH_SIZE = 500
+DEFAULT_POLL_SECONDS = 1.0
+DEFAULT_KEEPALIVE_SECONDS = 15.0
+RETRY_MS = 3000
+
+# Streams per process on workers where a stream costs a greenlet, not a thread
+DEFAULT_MAX_STREAMS = 1000
+ASYNC_WORKER_CLASSES = ("gevent", "eventlet")
+# On threaded workers at most 1 in this many request threads may hold a stream
+THREADS_PER_STREAM = 4
+
+# Tells this process's own notifications apart from other workers'
+_origin = uuid.uuid4().hex
+
+# "notify", "poll" or "off"; set by init_group_events
+_fanout = "off"
+
+
+# --------------------------------------------------
+# PUBLISHING
+# --------------------------------------------------
+
+def queue_group_event(group_id, type, **data):
+    """Publish an event about a group when the current transaction commits.
+
+    Nothing is sent if it rolls back. `data` must be JSON serializable.
+    Groups that were bumped without a queued event get a "changed" event.
+    """
+    db.session.info.setdefault("group_events", []).append((group_id, dict(type=type, **data)))
+
+
+def _pending_events(db_session):
+    versions = bumped_versions(db_session)
+    events = [
+        {**data, "group_id": group_id, "version": versions.get(group_id)}
+        for group_id, data in db_session.info.get("group_events", [])
+    ]
+    described = {e["group_id"] for e in events}
+    events += [
+        {"type": "changed", "group_id": group_id, "version": version}
+        for group_id, version in versions.items() if group_id not in described
+    ]
+    return events
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def _notify_other_workers(db_session):
+    if _fanout != "notify":
+        return
+    for e in _pending_events(db_session):
+        # Delivered to every listener when the transaction commits
+        payload = json.dumps({"origin": _origin, "event": e})
+        db_session.execute(select(func.pg_notify(NOTIFY_CHANNEL, payload)))
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _publish_committed(db_session):
+    events = _pending_events(db_session)
+    _forget_events(db_session)
+    for e in events:
+        hub.publish(e["group_id"], e)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_events(db_session):
+    db_session.info.pop("group_events", None)
+    db_session.info.pop("group_versions", None)
+
+
+# --------------------------------------------------
+# SUBSCRIBING
+# --------------------------------------------------
+
+class Subscription:
+    """One stream's queue of events for a group."""
+
+    def __init__(self, group_id, version):
+        self.group_id = group_id
+        self.version = version
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A slow client; it gets one "changed" event instead of the backlog
+            self.overflowed = True
+
+
+class GroupEventHub:
+    """In-process fan-out of group events to the subscriptions of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        # group_id -> newest version published; the watcher compares against it
+        self._versions = {}
+
+    def subscribe(self, group_id, version):
+        subscription = Subscription(group_id, version)
+        with self._lock:
+            self._subscriptions[group_id].add(subscription)
+            self._versions.setdefault(group_id, version)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.group_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.group_id]
+                del self._versions[subscription.group_id]
+
+    def publish(self, group_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(group_id, ()))
+            if subscriptions and event.get("version") is not None:
+                self._versions[group_id] = max(self._versions[group_id], event["version"])
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def watched(self):
+        """{group_id: newest version published} for groups with subscribers."""
+        with self._lock:
+            return dict(self._versions)
+
+    def stream_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscriptions.values())
+
+
+hub = GroupEventHub()
+
+
+def _format(event):
+    event_id = f"id: {event['version']}\n" if event.get("version") is not None else ""
+    return f"{event_id}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def event_stream(subscription, last_event_id=None, keepalive=DEFAULT_KEEPALIVE_SECONDS):
+    """Yield Server-Sent Events for a subscription until the client goes away.
+
+    Holds no database connection: an idle stream costs one queue and one
+    blocked thread (or greenlet). A keepalive comment every `keepalive`
+    seconds detects dropped clients. A client reconnecting with an older
+    Last-Event-ID gets a "changed" event straight away.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_event_id is not None and last_event_id < subscription.version:
+            yield _format({"type": "changed", "group_id": subscription.group_id,
+                           "version": subscription.version})
+
+        while True:
+            try:
+                event = subscription.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+
+            if subscription.overflowed:
+                subscription.overflowed = False
+                backlog = [event]
+                while True:
+                    try:
+                        backlog.append(subscription.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                versions = [e["version"] for e in backlog if e.get("version") is not None]
+                deleted = any(e["type"] == "deleted" for e in backlog)
+                event = {"type": "deleted" if deleted else "changed", "group_id": subscription.group_id,
+                         "version": max(versions) if versions else None}
+
+            version = event.get("version")
+            if version is not None:
+                if version <= subscription.version:
+                    continue  # seen before subscribing, or via another worker's poll
+                subscription.version = version
+
+            yield _format(event)
+            if event["type"] == "deleted":
+                return
+    finally:
+        hub.unsubscribe(subscription)
+
+
+# --------------------------------------------------
+# OTHER WORKERS
+# --------------------------------------------------
+
+class GroupWatcher:
+    """Brings events committed by other processes into this process's hub.
+
+    "notify" listens on a PostgreSQL channel that every commit notifies;
+    "poll" reads the versions of all watched groups in one query every
+    `poll_seconds` and publishes a "changed" event for each that moved.
+    Either way it is one thread and at most one query per interval,
+    however many streams are open.
+    """
+
+    def __init__(self, app, mode, poll_seconds=DEFAULT_POLL_SECONDS):
+        self.app = app
+        self.mode = mode
+        self.poll_seconds = poll_seconds
+        self._thread = threading.Thread(target=self._run, name=f"group-events-{mode}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    if self.mode == "notify":
+                        self._listen()
+                    else:
+                        self._poll_once()
+                except Exception:
+                    logger.exception("group event watcher failed")
+                finally:
+                    db.session.remove()
+                time.sleep(self.poll_seconds)
+
+    def _poll_once(self):
+        watched = list(hub.watched().items())
+        for start in range(0, len(watched), POLL_BATCH_SIZE):
+            batch = dict(watched[start:start + POLL_BATCH_SIZE])
+            live = dict(db.session.execute(
+                select(Group.id, Group.version).where(Group.id.in_(batch), Group.deleted_at.is_(None))
+            ).all())
+            for group_id, seen in batch.items():
+                if group_id not in live:
+                    hub.publish(group_id, {"type": "deleted", "group_id": group_id, "version": None})
+                elif live[group_id] > seen:
+                    hub.publish(group_id, {"type": "changed", "group_id": group_id, "version": live[group_id]})
+        db.session.commit()
+
+    def _listen(self):
+        # A connection of its own, detached so the pool can replace it
+        raw = db.engine.raw_connection()
+        raw.detach()
+        conn = raw.driver_connection
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            # Catch up on whatever was committed while not listening
+            self._poll_once()
+
+            while True:
+                if selectors.select([conn], [], [], DEFAULT_KEEPALIVE_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    payload = json.loads(conn.notifies.pop(0).payload)
+                    if payload["origin"] != _origin:
+                        e = payload["event"]
+                        hub.publish(e["group_id"], e)
+        finally:
+            conn.close()
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def init_group_events(app):
+    """Pick how events reach other processes from GROUP_EVENTS_FANOUT.
+
+    "auto" (the default) uses notify on PostgreSQL and poll elsewhere;
+    "off" only delivers events committed in the same process.
+    """
+    global _fanout
+    mode = app.config.get("GROUP_EVENTS_FANOUT") or "auto"
+    if mode == "auto":
+        uri = app.config.get("SQLALCHEMY_DATABASE_URI") or ""
+        mode = "notify" if uri.startswith("postgresql") else "poll"
+    if mode not in ("notify", "poll", "off"):
+        raise RuntimeError(f"Unknown GROUP_EVENTS_FANOUT {mode!r}")
+    _fanout = mode
+
+
+def stream_limit(worker_class, threads):
+    """Default GROUP_EVENTS_MAX_STREAMS for a gunicorn worker.
+
+    Each stream holds a request thread for its whole life, so threaded
+    workers only give streams a quarter of their threads; sync workers
+    get none and refuse streams with 503. Async workers get
+    DEFAULT_MAX_STREAMS.
+    """
+    if any(name in worker_class.lower() for name in ASYNC_WORKER_CLASSES):
+        return DEFAULT_MAX_STREAMS
+    return threads // THREADS_PER_STREAM
+
+
+def configure_stream_limit(app, worker_class, threads):
+    """Set the stream cap for this worker unless GROUP_EVENTS_MAX_STREAMS was given."""
+    if app.config.get("GROUP_EVENTS_MAX_STREAMS") is None:
+        app.config["GROUP_EVENTS_MAX_STREAMS"] = stream_limit(worker_class, threads)
+    limit = app.config["GROUP_EVENTS_MAX_STREAMS"]
+    if limit < DEFAULT_MAX_STREAMS:
+        logger.warning(
+            "%s workers cap event streams at %d per worker; route /api/groups/<id>/events "
+            "to a process started with gunicorn_events.conf.py", worker_class, limit
+        )
+
+
+def max_streams(app):
+    # Unset outside gunicorn, e.g. the threaded development server
+    limit = app.config.get("GROUP_EVENTS_MAX_STREAMS")
+    return DEFAULT_MAX_STREAMS if limit is None else limit
+
+
+def subscribe(app, group_id, version):
+    """Subscribe to a group's events, starting this process's watcher on first use."""
+    global _watcher
+    if _fanout != "off" and _watcher is None:
+        with _watcher_lock:
+            if _watcher is None:
+                _watcher = GroupWatcher(
+                    app, _fanout,
+                    poll_seconds=app.config.get("GROUP_EVENTS_POLL_SECONDS") or DEFAULT_POLL_SECONDS
+                )
+                _watcher.start()
+
+    return hub.subscribe(group_id, version)
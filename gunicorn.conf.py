@@ -0,0 +1,31 @@
+# gunicorn.conf.py — picked up automatically by `gunicorn app:app`
+import os
+import shutil
+
+# Threads keep a worker responsive while another request is hashing a password
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+
+def on_starting(server):
+    # Multiprocess metrics need an empty directory shared by all workers
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Start the job runner in every worker, not only those that get a request
+    from jobs import start_job_runner
+    start_job_runner(worker.wsgi)
+
+    # An event stream holds a request thread; keep enough free for everything else
+    from group_events import configure_stream_limit
+    configure_stream_limit(worker.wsgi, worker.cfg.worker_class_str, worker.cfg.threads)
@@ -0,0 +1,25 @@
+# gunicorn_events.conf.py — the event stream process: `gunicorn -c gunicorn_events.conf.py app:app`
+import os
+
+# An open stream is one greenlet, not a thread, so a worker can hold a thousand
+worker_class = "gevent"
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1100"))
+bind = os.environ.get("EVENTS_BIND", "0.0.0.0:8001")
+
+# Background jobs run in the web process
+raw_env = ["JOBS_ENABLED=0"]
+
+
+def post_fork(server, worker):
+    # Make psycopg2 wait on the gevent hub instead of blocking the whole worker
+    try:
+        import psycopg2  # noqa: F401
+    except ImportError:
+        return
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    from group_events import configure_stream_limit
+    configure_stream_limit(worker.wsgi, worker.cfg.worker_class_str, worker.cfg.threads)
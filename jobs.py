@@ -0,0 +1,349 @@
+# jobs.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import aliased
+from models import db, Job
+from db_routing import RoutingSession
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_SECONDS = 2.0
+DEFAULT_STALE_SECONDS = 60.0
+RETRY_BACKOFF_SECONDS = 5
+
+# First key of the PostgreSQL advisory locks that serialize claims per job type
+CLAIM_LOCK_CLASS = 7201
+
+# name -> JobType, filled by the @job_type decorator
+JOB_TYPES = {}
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+class JobFailed(Exception):
+    """Raise from a job to fail it without retrying."""
+
+
+class JobType:
+    def __init__(self, name, fn, concurrency, max_attempts, every):
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.every = every
+
+
+def job_type(name, concurrency=1, max_attempts=3, every=None):
+    """Register `fn(job, **params)` as the handler for jobs of type `name`.
+
+    At most `concurrency` jobs of the type run at once across all
+    processes sharing the database. A job that raises is retried with
+    exponential backoff until it has run `max_attempts` times; use
+    max_attempts=1 for work that is not safe to repeat. With `every`
+    (seconds), the runner keeps one parameterless job of the type
+    scheduled that far ahead.
+    """
+    def register(fn):
+        JOB_TYPES[name] = JobType(name, fn, concurrency, max_attempts, every)
+        return fn
+    return register
+
+
+def enqueue(name, **params):
+    """Add a job in the caller's transaction; it becomes runnable on commit.
+
+    `params` must be JSON serializable. Returns the (flushed) Job.
+    """
+    spec = JOB_TYPES[name]
+    job = Job(type=name, params=params, status="queued", max_attempts=spec.max_attempts,
+              run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.flush()
+    db.session.info["wake_job_runner"] = True
+    return job
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _wake_runner(db_session):
+    if db_session.info.pop("wake_job_runner", False) and _runner is not None:
+        _runner.wake()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _forget_wake(db_session):
+    db_session.info.pop("wake_job_runner", None)
+
+
+def job_json(job):
+    return {
+        "id": job.id,
+        "type": job.type,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def job_file(app, job_id, suffix):
+    """Path for a file belonging to a job, under JOB_FILES_DIR."""
+    directory = app.config.get("JOB_FILES_DIR") or os.path.join(app.instance_path, "job-files")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"job-{job_id}.{suffix}")
+
+
+class JobContext:
+    """Handed to a running job as its first argument."""
+
+    def __init__(self, job_id, attempt):
+        self.id = job_id
+        self.attempt = attempt
+        self._progress = {}
+
+    def progress(self, **values):
+        """Merge `values` into the job's progress.
+
+        Written on a connection of its own, so it neither commits nor
+        waits for the job's transaction.
+        """
+        self._progress.update(values)
+        with db.engine.begin() as conn:
+            conn.execute(update(Job).where(Job.id == self.id).values(progress=dict(self._progress)))
+
+
+class JobRunner:
+    """Claims queued jobs from the jobs table and runs them on a thread pool.
+
+    A dispatcher thread claims jobs when woken by a commit that enqueued
+    one, and otherwise every `poll_seconds`. It also heartbeats the jobs
+    this process is running; jobs whose heartbeat is older than
+    `stale_seconds` (their process died) are retried or failed.
+    """
+
+    def __init__(self, app, workers=DEFAULT_WORKERS, poll_seconds=DEFAULT_POLL_SECONDS,
+                 stale_seconds=DEFAULT_STALE_SECONDS):
+        self.app = app
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._last_heartbeat = 0
+        self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        self._pool.shutdown(wait=wait)
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    self._heartbeat()
+                    self._dispatch()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("job dispatcher failed")
+            self._wake.wait(self.poll_seconds)
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        if now - self._last_heartbeat < self.poll_seconds:
+            return
+        self._last_heartbeat = now
+
+        with self._lock:
+            running = list(self._running)
+        if running:
+            db.session.execute(
+                update(Job).where(Job.id.in_(running)).values(heartbeat_at=datetime.utcnow())
+            )
+
+        # Jobs of a process that died mid-run
+        stale = Job.status == "running", Job.heartbeat_at < datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        db.session.execute(
+            update(Job).where(*stale, Job.attempts >= Job.max_attempts)
+            .values(status="failed", error="worker stopped while running the job",
+                    finished_at=datetime.utcnow())
+        )
+        db.session.execute(
+            update(Job).where(*stale).values(status="queued", run_after=datetime.utcnow())
+        )
+
+        for spec in JOB_TYPES.values():
+            if spec.every and not db.session.execute(
+                select(Job.id).where(Job.type == spec.name, Job.status.in_(("queued", "running"))).limit(1)
+            ).first():
+                db.session.add(Job(type=spec.name, params={}, status="queued", max_attempts=spec.max_attempts,
+                                   run_after=datetime.utcnow() + timedelta(seconds=spec.every)))
+        db.session.commit()
+
+    def _dispatch(self):
+        with self._lock:
+            free = self.workers - len(self._running)
+        if free <= 0:
+            return
+
+        candidates = db.session.execute(
+            select(Job.id, Job.type)
+            .where(Job.status == "queued", Job.run_after <= datetime.utcnow())
+            .order_by(Job.run_after, Job.id)
+            .limit(free * 4)
+        ).all()
+
+        for job_id, name in candidates:
+            if free <= 0:
+                break
+            if self._claim(job_id, name):
+                free -= 1
+                with self._lock:
+                    self._running.add(job_id)
+                self._pool.submit(self._run, job_id)
+
+    def _claim(self, job_id, name):
+        """Mark a queued job running if its type has a free slot; False if another process won.
+
+        The running count is read inside the UPDATE. On PostgreSQL, claims
+        of the same type are serialized with an advisory lock held until
+        the commit, so under READ COMMITTED two processes cannot both see
+        the old count; SQLite already serializes all writers.
+        """
+        spec = JOB_TYPES.get(name)
+        running = aliased(Job)
+        claim = update(Job).where(Job.id == job_id, Job.status == "queued")
+        if spec is not None:
+            if db.engine.dialect.name == "postgresql":
+                db.session.execute(
+                    select(func.pg_advisory_xact_lock(CLAIM_LOCK_CLASS, func.hashtext(name)))
+                )
+            claim = claim.where(
+                select(func.count()).select_from(running)
+                .where(running.type == name, running.status == "running")
+                .scalar_subquery() < spec.concurrency
+            )
+
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            claim.values(status="running", attempts=Job.attempts + 1, started_at=now,
+                         heartbeat_at=now, error=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            name, params, attempt, max_attempts = job.type, dict(job.params or {}), job.attempts, job.max_attempts
+            db.session.commit()
+
+            spec = JOB_TYPES.get(name)
+            try:
+                if spec is None:
+                    raise JobFailed(f"unknown job type {name!r}")
+                result = spec.fn(JobContext(job_id, attempt), **params)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception("job %s (%s) failed on attempt %d", job_id, name, attempt)
+                self._finish_failed(job_id, e, retry=attempt < max_attempts and not isinstance(e, JobFailed))
+            else:
+                self._finish(job_id, status="succeeded", result=result, finished_at=datetime.utcnow())
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+                self.wake()
+
+    def _finish_failed(self, job_id, error, retry):
+        message = str(error) or error.__class__.__name__
+        if retry:
+            job = db.session.get(Job, job_id)
+            delay = RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+            self._finish(job_id, status="queued", error=message,
+                         run_after=datetime.utcnow() + timedelta(seconds=delay))
+        else:
+            self._finish(job_id, status="failed", error=message, finished_at=datetime.utcnow())
+
+    def _finish(self, job_id, **values):
+        try:
+            db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Left running; the stale check requeues it once heartbeats stop
+            self.app.logger.exception("could not record the outcome of job %s", job_id)
+
+    def wait_for_idle(self, timeout=None):
+        """Block until no job is queued and runnable or running (for scripts and benchmarks).
+
+        Scheduled periodic jobs that are not due yet do not count.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            with self.app.app_context():
+                busy = db.session.execute(
+                    select(func.count()).select_from(Job).where(
+                        (Job.status == "running")
+                        | ((Job.status == "queued") & (Job.run_after <= datetime.utcnow()))
+                    )
+                ).scalar()
+            if not busy:
+                return True
+            self.wake()
+            time.sleep(0.05)
+        return False
+
+
+def start_job_runner(app):
+    """Start this process's job runner once; a no-op when JOBS_ENABLED is off.
+
+    Threads do not survive a fork, so this runs in each worker process
+    (lazily on its first request, or from gunicorn's post_worker_init).
+    """
+    global _runner
+    if not app.config.get("JOBS_ENABLED", True):
+        return None
+
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(
+                app,
+                workers=app.config.get("JOB_WORKERS") or DEFAULT_WORKERS,
+                poll_seconds=app.config.get("JOB_POLL_SECONDS") or DEFAULT_POLL_SECONDS,
+                stale_seconds=app.config.get("JOB_STALE_SECONDS") or DEFAULT_STALE_SECONDS,
+            )
+            _runner.start()
+        return _runner
+
+
+def init_jobs(app):
+    @app.before_request
+    def ensure_job_runner():
+        if _runner is None:
+            start_job_runner(app)
+
+
+def wait_for_jobs(timeout=None):
+    """Wait for this process's runner to drain the queue; True if it did."""
+    return _runner.wait_for_idle(timeout) if _runner is not None else True
@@ -0,0 +1,376 @@
+# ledger_io.py
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import insert, select
+from models import db, GroupMember, Expense, ExpenseSplit, MemberSetMember, Settlement
+from balances import apply_balance_deltas
+from change_log import record_change
+from group_cache import bump_group_version
+from member_sets import can_compact, compact_splits, member_set_id
+from money import to_cents, from_cents, format_cents, split_evenly
+
+IMPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def _undecodable(values):
+    # The readers decode with errors="replace"; a replacement character marks invalid UTF-8
+    return any(isinstance(v, str) and "\ufffd" in v for v in values)
+
+
+# --------------------------------------------------
+# PARSING
+# --------------------------------------------------
+
+def _parse_csv_splits(value):
+    """`"3:12.5;4:7.5"` -> {"3": "12.5", "4": "7.5"}; blank means an even split."""
+    if not value or not value.strip():
+        return None
+
+    splits = {}
+    for part in value.split(";"):
+        uid, amt = part.split(":")
+        splits[uid] = amt
+    return splits
+
+
+def iter_csv_records(stream):
+    """Yield records from a binary CSV stream with a header row.
+
+    Unreadable rows are yielded as ImportRowError instances so a bad line
+    does not end the import.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline=""))
+    while True:
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield ImportRowError(f"unreadable row: {e}")
+            continue
+
+        if _undecodable(record.values()):
+            yield ImportRowError("row is not valid UTF-8")
+            continue
+
+        try:
+            record["splits"] = _parse_csv_splits(record.get("splits"))
+        except ValueError:
+            yield ImportRowError("splits must look like '<user_id>:<amount>;...'")
+            continue
+        yield record
+
+
+def iter_ndjson_records(stream):
+    """Yield records from a binary newline-delimited JSON stream."""
+    for line in io.TextIOWrapper(stream, encoding="utf-8", errors="replace"):
+        line = line.strip()
+        if not line:
+            continue
+        if _undecodable([line]):
+            yield ImportRowError("row is not valid UTF-8")
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield ImportRowError(f"unreadable row: {e}")
+            continue
+
+        if isinstance(record, dict):
+            yield record
+        else:
+            yield ImportRowError("each line must be a JSON object")
+
+
+def _clean_record(record, members):
+    """Validate one raw record against the group membership."""
+    try:
+        amount = to_cents(record["amount"])
+        paid_by = int(record["paid_by"])
+    except (KeyError, TypeError, ValueError):
+        raise ImportRowError("amount and paid_by are required numbers")
+
+    if amount <= 0:
+        raise ImportRowError("amount must be greater than zero")
+    if paid_by not in members:
+        raise ImportRowError(f"payer {paid_by} is not a group member")
+
+    splits = record.get("splits")
+    if splits:
+        if not isinstance(splits, dict):
+            raise ImportRowError("splits must map user ids to amounts")
+        try:
+            splits = {int(uid): to_cents(amt) for uid, amt in splits.items()}
+        except (TypeError, ValueError):
+            raise ImportRowError("splits must map user ids to amounts")
+
+        if any(cents < 0 for cents in splits.values()):
+            raise ImportRowError("split amounts cannot be negative")
+
+        outsiders = set(splits) - members
+        if outsiders:
+            raise ImportRowError(f"split users {sorted(outsiders)} are not group members")
+        if sum(splits.values()) != amount:
+            raise ImportRowError("splits do not add up to amount")
+    else:
+        ordered = sorted(members)
+        splits = dict(zip(ordered, split_evenly(amount, len(ordered))))
+
+    created_at = record.get("created_at")
+    try:
+        created_at = datetime.fromisoformat(created_at) if created_at else datetime.utcnow()
+    except (TypeError, ValueError):
+        raise ImportRowError("created_at must be an ISO 8601 timestamp")
+
+    description = record.get("description") or None
+    if description is not None:
+        if not isinstance(description, str):
+            raise ImportRowError("description must be text")
+        if len(description) > Expense.description.type.length:
+            raise ImportRowError(f"description is longer than {Expense.description.type.length} characters")
+
+    return {
+        "amount_cents": amount,
+        "paid_by": paid_by,
+        "description": description,
+        "created_at": created_at,
+        "splits": splits,
+    }
+
+
+# --------------------------------------------------
+# IMPORT
+# --------------------------------------------------
+
+def _insert_chunk(group_id, rows):
+    """Insert a chunk of cleaned rows as two multi-row INSERTs and commit."""
+    known_sets = {}
+    for r in rows:
+        r["member_set_id"] = (
+            member_set_id(group_id, r["splits"], known_sets)
+            if can_compact(r["amount_cents"], r["splits"]) else None
+        )
+
+    bump_group_version(group_id)
+
+    expense_ids = db.session.execute(
+        insert(Expense).returning(Expense.id, sort_by_parameter_order=True),
+        [
+            {
+                "group_id": group_id,
+                "amount_cents": r["amount_cents"],
+                "paid_by": r["paid_by"],
+                "description": r["description"],
+                "created_at": r["created_at"],
+                "member_set_id": r["member_set_id"],
+            }
+            for r in rows
+        ]
+    ).scalars().all()
+
+    split_rows = []
+    deltas = []
+    for expense_id, r in zip(expense_ids, rows):
+        deltas.append((r["paid_by"], r["amount_cents"]))
+        for uid, amt in r["splits"].items():
+            deltas.append((uid, -amt))
+            if r["member_set_id"] is None:
+                split_rows.append({"expense_id": expense_id, "user_id": uid, "amount_owed_cents": amt})
+
+    if split_rows:
+        db.session.execute(insert(ExpenseSplit), split_rows)
+    apply_balance_deltas(group_id, deltas)
+    for expense_id in expense_ids:
+        record_change(group_id, "expense", expense_id)
+    db.session.commit()
+
+
+def import_expenses(group_id, records, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Validate and insert expense records in chunked transactions.
+
+    `records` is any iterable of raw dicts (or ImportRowError for lines the
+    parser could not read), consumed lazily. Invalid rows are skipped and
+    reported. A chunk that fails to insert is rolled back and retried one
+    row per transaction, so only the rows that fail again are lost and
+    reported. `progress(imported=, failed=)` is called after every chunk.
+    """
+    members = set(db.session.execute(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+    ).scalars())
+
+    imported = 0
+    failed = 0
+    errors = []
+    chunk = []
+    chunk_rows = []
+
+    def report(row, message):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row, "error": message})
+
+    def flush_chunk():
+        nonlocal imported, failed
+        try:
+            _insert_chunk(group_id, chunk)
+            imported += len(chunk)
+        except Exception:
+            db.session.rollback()
+            for row, cleaned in zip(chunk_rows, chunk):
+                try:
+                    _insert_chunk(group_id, [cleaned])
+                    imported += 1
+                except Exception as e:
+                    db.session.rollback()
+                    failed += 1
+                    report(row, f"insert failed: {e.__class__.__name__}")
+
+        if progress:
+            progress(imported=imported, failed=failed)
+
+    for row, record in enumerate(records, start=1):
+        try:
+            if isinstance(record, ImportRowError):
+                raise record
+            cleaned = _clean_record(record, members)
+        except ImportRowError as e:
+            failed += 1
+            report(row, str(e))
+            continue
+
+        chunk.append(cleaned)
+        chunk_rows.append(row)
+
+        if len(chunk) >= chunk_size:
+            flush_chunk()
+            chunk = []
+            chunk_rows = []
+
+    if chunk:
+        flush_chunk()
+
+    return {"imported": imported, "failed": failed, "errors": errors}
+
+
+# --------------------------------------------------
+# EXPORT
+# --------------------------------------------------
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = [
+    "record_type", "id", "expense_id", "user_id", "counterparty_id",
+    "amount", "description", "created_at",
+]
+
+
+def _iter_ledger_records(group_id):
+    """Yield every expense, split and settlement of a group as flat dicts.
+
+    Amounts are integer cents; the writers convert them for output.
+
+    Each table is read with yield_per, which streams rows through a
+    server-side cursor where the driver supports one.
+    """
+    streamed = {"yield_per": EXPORT_BATCH_SIZE}
+
+    expenses = db.session.execute(
+        select(Expense.id, Expense.paid_by, Expense.amount_cents, Expense.description, Expense.created_at)
+        .where(Expense.group_id == group_id)
+        .order_by(Expense.id)
+        .execution_options(**streamed)
+    )
+    for e in expenses:
+        yield {
+            "record_type": "expense",
+            "id": e.id,
+            "user_id": e.paid_by,
+            "amount": e.amount_cents,
+            "description": e.description,
+            "created_at": e.created_at.isoformat(),
+        }
+
+    splits = db.session.execute(
+        select(ExpenseSplit.id, ExpenseSplit.expense_id, ExpenseSplit.user_id, ExpenseSplit.amount_owed_cents)
+        .join(Expense, Expense.id == ExpenseSplit.expense_id)
+        .where(Expense.group_id == group_id)
+        .order_by(ExpenseSplit.id)
+        .execution_options(**streamed)
+    )
+    for s in splits:
+        yield {
+            "record_type": "split",
+            "id": s.id,
+            "expense_id": s.expense_id,
+            "user_id": s.user_id,
+            "amount": s.amount_owed_cents,
+        }
+
+    # Even splits stored as member sets have no split row id of their own
+    compact = db.session.execute(
+        compact_splits(Expense.group_id == group_id)
+        .order_by(Expense.id, MemberSetMember.position)
+        .execution_options(**streamed)
+    )
+    for s in compact:
+        yield {
+            "record_type": "split",
+            "id": None,
+            "expense_id": s.expense_id,
+            "user_id": s.user_id,
+            "amount": s.amount_owed_cents,
+        }
+
+    settlements = db.session.execute(
+        select(Settlement.id, Settlement.payer_id, Settlement.receiver_id, Settlement.amount_cents, Settlement.created_at)
+        .where(Settlement.group_id == group_id)
+        .order_by(Settlement.id)
+        .execution_options(**streamed)
+    )
+    for s in settlements:
+        yield {
+            "record_type": "settlement",
+            "id": s.id,
+            "user_id": s.payer_id,
+            "counterparty_id": s.receiver_id,
+            "amount": s.amount_cents,
+            "created_at": s.created_at.isoformat(),
+        }
+
+
+def export_csv(group_id):
+    """Yield the group ledger as CSV text in batches of rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, lineterminator="\n")
+    writer.writeheader()
+
+    for n, record in enumerate(_iter_ledger_records(group_id), start=1):
+        record["amount"] = format_cents(record["amount"])
+        writer.writerow(record)
+        if n % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def export_ndjson(group_id):
+    """Yield the group ledger as newline-delimited JSON in batches of rows."""
+    lines = []
+    for record in _iter_ledger_records(group_id):
+        record["amount"] = from_cents(record["amount"])
+        lines.append(json.dumps(record))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -0,0 +1,145 @@
+# member_sets.py
+import hashlib
+from sqlalchemy import bindparam, case, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Expense, ExpenseSplit, MemberSet, MemberSetMember
+from money import split_evenly
+
+COMPACT_BATCH_SIZE = 1000
+
+
+def signature(user_ids):
+    return hashlib.sha256(",".join(map(str, sorted(user_ids))).encode()).hexdigest()
+
+
+def can_compact(amount_cents, splits):
+    """True if `splits` ({user_id: cents}) is an even split of the amount between two or more users.
+
+    split_evenly hands the leftover cents to the lowest user ids, which is
+    the order member set positions follow.
+    """
+    users = sorted(splits)
+    return len(users) > 1 and [splits[u] for u in users] == split_evenly(amount_cents, len(users))
+
+
+def member_set_id(group_id, user_ids, known=None):
+    """Id of the group's member set for `user_ids`, creating it in the current transaction.
+
+    `known` is an optional {signature: id} dict that spares repeated lookups
+    within one transaction; it must not outlive it, since a set created here
+    disappears on rollback.
+    """
+    sig = signature(user_ids)
+    if known is not None and sig in known:
+        return known[sig]
+
+    lookup = select(MemberSet.id).where(MemberSet.group_id == group_id, MemberSet.signature == sig)
+    set_id = db.session.execute(lookup).scalar()
+    if set_id is None:
+        set_id = _create_member_set(group_id, sig, sorted(user_ids), lookup)
+
+    if known is not None:
+        known[sig] = set_id
+    return set_id
+
+
+def _create_member_set(group_id, sig, users, lookup):
+    try:
+        with db.session.begin_nested():
+            set_id = db.session.execute(
+                insert(MemberSet)
+                .values(group_id=group_id, signature=sig, size=len(users))
+                .returning(MemberSet.id)
+            ).scalar_one()
+            db.session.execute(insert(MemberSetMember), [
+                {"member_set_id": set_id, "position": position, "user_id": uid}
+                for position, uid in enumerate(users)
+            ])
+    except IntegrityError:
+        # Created concurrently by another request
+        set_id = db.session.execute(lookup).scalar_one()
+
+    return set_id
+
+
+def compact_splits(expense_filter):
+    """(expense_id, user_id, owed cents) for member-set expenses matching `expense_filter`.
+
+    Expands each compact expense in SQL: everyone owes amount // size and
+    the first amount % size positions owe one cent more.
+    """
+    owed = (
+        Expense.amount_cents // MemberSet.size
+        + case((MemberSetMember.position < Expense.amount_cents % MemberSet.size, 1), else_=0)
+    )
+    return (
+        select(Expense.id.label("expense_id"), MemberSetMember.user_id.label("user_id"),
+               owed.label("amount_owed_cents"))
+        .join(MemberSet, MemberSet.id == Expense.member_set_id)
+        .join(MemberSetMember, MemberSetMember.member_set_id == MemberSet.id)
+        .where(expense_filter)
+    )
+
+
+def delete_member_sets(group_id):
+    """Remove a group's member sets. Does not commit; expenses must be gone first."""
+    set_ids = select(MemberSet.id).where(MemberSet.group_id == group_id)
+    db.session.execute(delete(MemberSetMember).where(MemberSetMember.member_set_id.in_(set_ids)))
+    db.session.execute(delete(MemberSet).where(MemberSet.group_id == group_id))
+
+
+def compact_group_splits(group_id, batch_size=COMPACT_BATCH_SIZE):
+    """Replace per-user split rows of evenly split expenses with member sets.
+
+    Works through the group's expenses in id order, committing per batch.
+    Balances are unchanged, so the ledger and group version are left alone.
+    Returns the number of expenses compacted.
+    """
+    compacted = 0
+    last_id = 0
+    known = {}  # safe across batches: each one is committed before the next
+
+    while True:
+        batch = db.session.execute(
+            select(Expense.id, Expense.amount_cents)
+            .where(Expense.group_id == group_id, Expense.member_set_id.is_(None), Expense.id > last_id)
+            .order_by(Expense.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            return compacted
+        last_id = batch[-1].id
+
+        splits = {}
+        duplicated = set()
+        for expense_id, user_id, owed in db.session.execute(
+            select(ExpenseSplit.expense_id, ExpenseSplit.user_id, ExpenseSplit.amount_owed_cents)
+            .where(ExpenseSplit.expense_id.in_([e.id for e in batch]))
+        ):
+            # Two rows for one user can't be expressed as a member set
+            if user_id in splits.setdefault(expense_id, {}):
+                duplicated.add(expense_id)
+            splits[expense_id][user_id] = owed
+
+        updates = [
+            {"expense_id": e.id, "set_id": member_set_id(group_id, splits[e.id], known)}
+            for e in batch
+            if e.id in splits
+            and e.id not in duplicated
+            and can_compact(e.amount_cents, splits[e.id])
+        ]
+
+        if updates:
+            expenses = Expense.__table__
+            db.session.execute(
+                update(expenses)
+                .where(expenses.c.id == bindparam("expense_id"))
+                .values(member_set_id=bindparam("set_id")),
+                updates
+            )
+            db.session.execute(
+                delete(ExpenseSplit)
+                .where(ExpenseSplit.expense_id.in_([u["expense_id"] for u in updates]))
+            )
+        db.session.commit()
+        compacted += len(updates)
@@ -0,0 +1,114 @@
+# metrics.py
+import os
+import time
+from collections import Counter
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610, 1000)
+
+REQUEST_LATENCY = Histogram(
+    "ledger_request_seconds", "Total request latency.", ["endpoint", "method"]
+)
+REQUEST_DB_TIME = Histogram(
+    "ledger_request_db_seconds", "Time spent executing SQL per request.", ["endpoint", "method"]
+)
+REQUEST_QUERIES = Histogram(
+    "ledger_request_queries", "SQL statements executed per request.", ["endpoint", "method"],
+    buckets=QUERY_BUCKETS
+)
+
+
+class QueryStats:
+    """SQL statements seen during one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+
+
+def request_query_stats():
+    """QueryStats of the current request, or None outside a request."""
+    if not has_request_context():
+        return None
+    if "query_stats" not in g:
+        g.query_stats = QueryStats()
+    return g.query_stats
+
+
+# Listening on the Engine class covers every bind, including replicas
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+
+    stats = request_query_stats()
+    if stats is not None:
+        stats.count += 1
+        stats.db_time += elapsed
+        stats.statements[statement] += 1
+
+
+def _metrics_registry():
+    # gunicorn workers each write their samples to PROMETHEUS_MULTIPROC_DIR;
+    # a scrape of any worker aggregates all of them
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def init_metrics(app):
+    """Time every request, expose /metrics and log slow or chatty requests.
+
+    SLOW_REQUEST_MS and SLOW_REQUEST_QUERIES (0 disables) set the logging
+    thresholds.
+    """
+    slow_ms = app.config.get("SLOW_REQUEST_MS", 0)
+    slow_queries = app.config.get("SLOW_REQUEST_QUERIES", 0)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+        request_query_stats()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if "request_started_at" not in g:
+            return response
+
+        total = time.perf_counter() - g.request_started_at
+        stats = request_query_stats()
+        endpoint = request.endpoint or "unmatched"
+
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(total)
+        REQUEST_DB_TIME.labels(endpoint, request.method).observe(stats.db_time)
+        REQUEST_QUERIES.labels(endpoint, request.method).observe(stats.count)
+
+        response.headers["X-Query-Count"] = str(stats.count)
+        response.headers["Server-Timing"] = (
+            f"db;dur={stats.db_time * 1000:.1f}, total;dur={total * 1000:.1f}"
+        )
+
+        if (slow_ms and total * 1000 > slow_ms) or (slow_queries and stats.count > slow_queries):
+            app.logger.warning(
+                "slow request %s %s: %.1f ms, %d queries (%.1f ms in db)",
+                request.method, request.full_path.rstrip("?"),
+                total * 1000, stats.count, stats.db_time * 1000
+            )
+
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(generate_latest(_metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,153 @@
+# migrations.py
+from sqlalchemy import bindparam, inspect, text
+from models import db, GroupBalance
+from money import allocate
+
+# (table, legacy Float column, integer cents column)
+MONEY_COLUMNS = [
+    ("expenses", "amount", "amount_cents"),
+    ("expense_splits", "amount_owed", "amount_owed_cents"),
+    ("settlements", "amount", "amount_cents"),
+]
+
+# Columns added to existing tables: (table, column, DDL type and default)
+ADDED_COLUMNS = [
+    ("groups", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("expenses", "member_set_id", "INTEGER REFERENCES member_sets(id)"),
+    ("groups", "deleted_at", "TIMESTAMP"),
+    ("groups", "updated_at", "TIMESTAMP"),
+]
+
+REALLOCATE_BATCH_SIZE = 500
+
+
+def upgrade_schema():
+    """Bring an existing database up to date with models.py.
+
+    db.create_all() only creates missing tables, so column changes and
+    indexes added to existing tables are applied here. Every step is
+    idempotent.
+    """
+    engine = db.engine
+
+    with engine.begin() as conn:
+        _add_columns(conn)
+        _convert_money_to_cents(conn)
+        _add_delete_cascades(conn)
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _columns(conn, table):
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_columns(conn):
+    for table, column, ddl in ADDED_COLUMNS:
+        if column not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _add_delete_cascades(conn):
+    """Recreate foreign keys that models.py declares ON DELETE CASCADE.
+
+    SQLite cannot alter constraints (and does not enforce them by
+    default), so only PostgreSQL databases are upgraded.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+
+    for table in db.metadata.sorted_tables:
+        existing = {
+            tuple(fk["constrained_columns"]): fk for fk in inspect(conn).get_foreign_keys(table.name)
+        }
+        for constraint in table.foreign_key_constraints:
+            if constraint.ondelete != "CASCADE":
+                continue
+            fk = existing.get(tuple(constraint.column_keys))
+            if not fk or (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+                continue
+
+            columns = ", ".join(constraint.column_keys)
+            referred = ", ".join(fk["referred_columns"])
+            conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{fk["name"]}"'))
+            conn.execute(text(
+                f'ALTER TABLE {table.name} ADD CONSTRAINT "{fk["name"]}" '
+                f"FOREIGN KEY ({columns}) REFERENCES {fk['referred_table']} ({referred}) "
+                f"ON DELETE CASCADE"
+            ))
+
+
+def _convert_money_to_cents(conn):
+    """Replace the Float money columns of older databases with BIGINT cents."""
+    pending = [
+        (table, old, new)
+        for table, old, new in MONEY_COLUMNS
+        if old in _columns(conn, table)
+    ]
+
+    for table, old, new in pending:
+        if new not in _columns(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {new} BIGINT NOT NULL DEFAULT 0"))
+        conn.execute(text(f"UPDATE {table} SET {new} = CAST(ROUND({old} * 100) AS BIGINT)"))
+
+    if any(table == "expense_splits" for table, _, _ in pending):
+        _reallocate_rounded_splits(conn)
+
+    for table, old, _ in pending:
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {old}"))
+
+    # The ledger is derived data: drop a Float one and let it rebuild lazily
+    if "net" in _columns(conn, GroupBalance.__tablename__):
+        GroupBalance.__table__.drop(conn)
+        GroupBalance.__table__.create(conn)
+
+
+def _reallocate_rounded_splits(conn):
+    """Fix splits whose individually rounded cents no longer add up.
+
+    An even float split such as 100 / 3 rounds to 33.33 three times. When
+    the float splits did add up to the expense amount, the cents are
+    reassigned by largest remainder so they sum exactly again. Splits that
+    never added up are left alone.
+    """
+    mismatched = conn.execute(text(
+        "SELECT e.id, e.amount_cents FROM expenses e "
+        "JOIN expense_splits s ON s.expense_id = e.id "
+        "GROUP BY e.id, e.amount_cents "
+        "HAVING SUM(s.amount_owed_cents) != e.amount_cents "
+        "AND CAST(ROUND(SUM(s.amount_owed) * 100) AS BIGINT) = e.amount_cents"
+    )).all()
+
+    for start in range(0, len(mismatched), REALLOCATE_BATCH_SIZE):
+        batch = dict(mismatched[start:start + REALLOCATE_BATCH_SIZE])
+
+        splits = {}
+        rows = conn.execute(
+            text(
+                "SELECT expense_id, id, amount_owed FROM expense_splits "
+                "WHERE expense_id IN :ids ORDER BY expense_id, id"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"ids": list(batch)}
+        )
+        for expense_id, split_id, amount_owed in rows:
+            splits.setdefault(expense_id, []).append((split_id, amount_owed))
+
+        updates = []
+        for expense_id, parts in splits.items():
+            try:
+                shares = allocate(batch[expense_id], [amt for _, amt in parts])
+            except ValueError:
+                continue
+            updates.extend(
+                {"id": split_id, "cents": cents}
+                for (split_id, _), cents in zip(parts, shares)
+            )
+
+        if updates:
+            conn.execute(
+                text("UPDATE expense_splits SET amount_owed_cents = :cents WHERE id = :id"),
+                updates
+            )
@@ -1,9 +1,10 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from db_routing import RoutingSession
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class User(db.Model):
     __tablename__ = "expense_users"
@@ -19,42 +20,162 @@ class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     created_by = db.Column(db.Integer, db.ForeignKey("expense_users.id"))
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Moves with version; sent as Last-Modified
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set when the group is deleted; its rows are purged in the background
+    deleted_at = db.Column(db.DateTime)
 
 
 class GroupMember(db.Model):
     __tablename__ = "group_members"
+    __table_args__ = (
+        # A user's groups (summary, sync, dashboard) without touching group rows
+        db.Index("ix_group_members_user_group", "user_id", "group_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey("groups.id"))
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.id", ondelete="CASCADE"))
     user_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"))
 
 
 class Expense(db.Model):
     __tablename__ = "expenses"
+    __table_args__ = (
+        db.Index("ix_expenses_group_created", "group_id", "created_at", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey("groups.id"))
-    amount = db.Column(db.Float, nullable=False)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.id", ondelete="CASCADE"))
+    amount_cents = db.Column(db.BigInteger, nullable=False)
     description = db.Column(db.String(255))
     paid_by = db.Column(db.Integer, db.ForeignKey("expense_users.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set for even splits, which are stored as a member set instead of ExpenseSplit rows
+    member_set_id = db.Column(db.Integer, db.ForeignKey("member_sets.id"))
+
+
+class MemberSet(db.Model):
+    """The users an even split is shared between, reused by every expense split that way."""
+    __tablename__ = "member_sets"
+    __table_args__ = (
+        db.UniqueConstraint("group_id", "signature", name="uq_member_sets_group_signature"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.id", ondelete="CASCADE"), nullable=False)
+    signature = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+
+
+class MemberSetMember(db.Model):
+    """Members by ascending user id; positions below amount % size owe one extra cent."""
+    __tablename__ = "member_set_members"
+
+    member_set_id = db.Column(
+        db.Integer, db.ForeignKey("member_sets.id", ondelete="CASCADE"), primary_key=True
+    )
+    position = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"), nullable=False)
 
 
 class ExpenseSplit(db.Model):
     __tablename__ = "expense_splits"
 
     id = db.Column(db.Integer, primary_key=True)
-    expense_id = db.Column(db.Integer, db.ForeignKey("expenses.id"))
+    expense_id = db.Column(db.Integer, db.ForeignKey("expenses.id", ondelete="CASCADE"), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"))
-    amount_owed = db.Column(db.Float, nullable=False)
+    amount_owed_cents = db.Column(db.BigInteger, nullable=False)
 
 
 class Settlement(db.Model):
     __tablename__ = "settlements"
+    __table_args__ = (
+        db.Index("ix_settlements_group_created", "group_id", "created_at", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    group_id = db.Column(db.Integer, db.ForeignKey("groups.id"))
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.id", ondelete="CASCADE"))
     payer_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"))
     receiver_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"))
-    amount = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class GroupBalance(db.Model):
+    __tablename__ = "group_balances"
+
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.id", ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"), primary_key=True)
+    net_cents = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class BalanceSnapshot(db.Model):
+    """Per-member net balances of a group up to a watermark of expense and settlement ids."""
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (
+        db.Index("ix_balance_snapshots_group_id", "group_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, db.ForeignKey("groups.id", ondelete="CASCADE"), nullable=False)
+    # Groups.version when taken; the scheduler counts writes since then
+    group_version = db.Column(db.Integer, nullable=False)
+    last_expense_id = db.Column(db.Integer, nullable=False, default=0)
+    last_settlement_id = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class BalanceSnapshotEntry(db.Model):
+    __tablename__ = "balance_snapshot_entries"
+
+    snapshot_id = db.Column(
+        db.Integer, db.ForeignKey("balance_snapshots.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey("expense_users.id"), primary_key=True)
+    net_cents = db.Column(db.BigInteger, nullable=False)
+
+
+class Change(db.Model):
+    """One row per created, changed or deleted entity; its id is the sync cursor.
+
+    No foreign keys: rows outlive the groups and entities they describe.
+    user_id is only set on rows meant for one user (group deletions).
+    """
+    __tablename__ = "changes"
+    __table_args__ = (
+        db.Index("ix_changes_group_id", "group_id", "id"),
+        db.Index("ix_changes_user_id", "user_id", "id"),
+        # Ids must never be reused, even after pruning empties the table
+        {"sqlite_autoincrement": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    """A unit of background work run by jobs.JobRunner."""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    progress = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
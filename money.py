@@ -0,0 +1,57 @@
+# money.py
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from fractions import Fraction
+
+CENTS_PER_UNIT = 100
+
+
+def to_cents(value):
+    """Parse a user-supplied amount ("12.34", 12.34, Decimal) into integer cents."""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid amount: {value!r}")
+
+    if not amount.is_finite():
+        raise ValueError(f"invalid amount: {value!r}")
+
+    return int((amount * CENTS_PER_UNIT).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Integer cents -> float units, for JSON responses and templates."""
+    return cents / CENTS_PER_UNIT
+
+
+def format_cents(cents):
+    """Integer cents -> exact decimal string, e.g. -1205 -> "-12.05"."""
+    sign = "-" if cents < 0 else ""
+    units, rest = divmod(abs(cents), CENTS_PER_UNIT)
+    return f"{sign}{units}.{rest:02d}"
+
+
+def allocate(total, weights):
+    """Split integer `total` in proportion to `weights` by largest remainder.
+
+    The result always sums to `total`. Leftover cents go to the largest
+    fractional shares, ties broken by position, so the same inputs always
+    give the same allocation.
+    """
+    weights = [Fraction(w) for w in weights]
+    weight_sum = sum(weights)
+    if not weights or weight_sum <= 0 or any(w < 0 for w in weights):
+        raise ValueError("weights must be non-negative with a positive sum")
+
+    exact = [total * w / weight_sum for w in weights]
+    shares = [int(e // 1) for e in exact]
+
+    leftover = total - sum(shares)
+    by_remainder = sorted(range(len(exact)), key=lambda i: (-(exact[i] - shares[i]), i))
+    for i in by_remainder[:leftover]:
+        shares[i] += 1
+
+    return shares
+
+
+def split_evenly(total, count):
+    return allocate(total, [1] * count)
@@ -0,0 +1,61 @@
+# pagination.py
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        limit = int(value) if value is not None else default
+    except ValueError:
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, model, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Newest-first page of `query` ordered by (created_at, id).
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(
+            or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < row_id)
+            )
+        )
+
+    rows = (
+        query
+        .order_by(model.created_at.desc(), model.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return rows, None
@@ -0,0 +1,58 @@
+# passwords.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = "scrypt"
+
+_method = None
+_pool = None
+
+
+def _canonical_method(method):
+    # Werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1");
+    # stored hashes carry the expanded form, so compare against that
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def init_passwords(app):
+    """Configure hashing from PASSWORD_HASH_METHOD and PASSWORD_HASH_WORKERS.
+
+    scrypt and pbkdf2 release the GIL, so a small thread pool hashes in
+    parallel with request threads instead of stalling the worker.
+    """
+    global _method, _pool
+
+    _method = _canonical_method(app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_METHOD)
+    workers = app.config.get("PASSWORD_HASH_WORKERS") or min(4, os.cpu_count() or 1)
+
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+    _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+
+def _run(fn, *args):
+    if _pool is None:
+        return fn(*args)
+    return _pool.submit(fn, *args).result()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _method or DEFAULT_METHOD)
+
+
+def needs_rehash(stored_hash):
+    return _method is not None and stored_hash.split("$", 1)[0] != _method
+
+
+def verify_password(stored_hash, password):
+    """Check a password; returns (ok, new_hash).
+
+    new_hash is set when the password matched but was stored with other
+    hashing parameters than the configured ones; the caller should save it.
+    """
+    if not _run(check_password_hash, stored_hash, password):
+        return False, None
+    if needs_rehash(stored_hash):
+        return True, hash_password(password)
+    return True, None
@@ -0,0 +1,104 @@
+# query_budget.py
+import re
+import threading
+from collections import Counter
+from contextlib import ContextDecorator
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from metrics import request_query_stats
+
+DEV_REPEAT_WARN = 10
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement):
+    """Collapse the parts of a statement that vary between otherwise identical queries."""
+    shape = re.sub(r"\s+", " ", statement).strip()
+    shape = re.sub(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+|__\[POSTCOMPILE_\w+\])\s*,?)+\)", "(?)", shape)
+    shape = re.sub(r"\b\d+\b", "N", shape)
+    return shape
+
+
+class QueryBudget(ContextDecorator):
+    """Fail when a block or function issues more than `max_queries` statements.
+
+        with QueryBudget(3, "group page"):
+            client.get("/groups/1")
+
+        @QueryBudget(2)
+        def load_dashboard(): ...
+
+    Counts statements on every engine in the current thread, so a Flask
+    test client request made inside the block is included.
+    """
+
+    def __init__(self, max_queries, label=None):
+        self.max_queries = max_queries
+        self.label = label
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.statements = []
+        _active_budgets().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_budgets().remove(self)
+        if exc_type is None and self.count > self.max_queries:
+            shapes = Counter(statement_shape(s) for s in self.statements)
+            detail = "\n".join(f"  {n}x {shape}" for shape, n in shapes.most_common(5))
+            raise QueryBudgetExceeded(
+                f"{self.label or 'block'} ran {self.count} queries, budget is "
+                f"{self.max_queries}. Most frequent:\n{detail}"
+            )
+        return False
+
+
+def _active_budgets():
+    if not hasattr(_local, "budgets"):
+        _local.budgets = []
+    return _local.budgets
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_for_budgets(conn, cursor, statement, parameters, context, executemany):
+    for budget in _active_budgets():
+        budget.statements.append(statement)
+
+
+def init_repeat_warnings(app):
+    """Warn when one statement shape runs more than QUERY_REPEAT_WARN times in a request.
+
+    Repeated shapes are the signature of an N+1 loop. Enabled in debug
+    mode (default threshold 10) or whenever QUERY_REPEAT_WARN is set.
+    """
+
+    @app.after_request
+    def warn_repeated_queries(response):
+        threshold = app.config.get("QUERY_REPEAT_WARN") or (DEV_REPEAT_WARN if app.debug else 0)
+        stats = request_query_stats()
+        if not threshold or stats is None:
+            return response
+
+        shapes = Counter()
+        for statement, n in stats.statements.items():
+            shapes[statement_shape(statement)] += n
+
+        for shape, n in shapes.items():
+            if n > threshold:
+                app.logger.warning(
+                    "%s %s ran the same query %d times: %s",
+                    request.method, request.path, n, shape
+                )
+
+        return response
@@ -0,0 +1,186 @@
+# solver.py
+import time
+from cache import LRUCache
+
+# Exact search is O(2^n * n) in the number of non-zero balances
+EXACT_MAX_MEMBERS = 14
+DEFAULT_TIME_BUDGET = 0.05  # seconds
+
+_solutions = LRUCache(maxsize=2048)
+
+
+def greedy_transfers(balances):
+    """Match the largest debtor with the largest creditor until all are settled.
+
+    `balances` maps user ids to net cents. Returns (from, to, cents) tuples.
+    """
+    creditors = []
+    debtors = []
+
+    for user_id, balance in balances.items():
+        if balance > 0:
+            creditors.append([user_id, balance])
+        elif balance < 0:
+            debtors.append([user_id, -balance])
+
+    creditors.sort(key=lambda x: x[1], reverse=True)
+    debtors.sort(key=lambda x: x[1], reverse=True)
+
+    transfers = []
+
+    i = j = 0
+    while i < len(debtors) and j < len(creditors):
+        debtor_id, debtor_amt = debtors[i]
+        creditor_id, creditor_amt = creditors[j]
+
+        settle_amt = min(debtor_amt, creditor_amt)
+        transfers.append((debtor_id, creditor_id, settle_amt))
+
+        debtors[i][1] -= settle_amt
+        creditors[j][1] -= settle_amt
+
+        if debtors[i][1] == 0:
+            i += 1
+        if creditors[j][1] == 0:
+            j += 1
+
+    return transfers
+
+
+def _exact_partition(entries):
+    """Split entries into the largest possible number of zero-sum subsets.
+
+    Bitmask DP: dp[mask] is the most zero-sum groups that the members in
+    `mask` can be cut into. Walking back from the full mask, consecutive
+    zero-sum masks on the path differ by one zero-sum group.
+    """
+    n = len(entries)
+    size = 1 << n
+    amounts = [balance for _, balance in entries]
+
+    sums = [0] * size
+    for mask in range(1, size):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + amounts[low.bit_length() - 1]
+
+    dp = [0] * size
+    for mask in range(1, size):
+        best = 0
+        rest = mask
+        while rest:
+            low = rest & -rest
+            if dp[mask ^ low] > best:
+                best = dp[mask ^ low]
+            rest ^= low
+        dp[mask] = best + (sums[mask] == 0)
+
+    zero_masks = []
+    mask = size - 1
+    while mask:
+        if sums[mask] == 0:
+            zero_masks.append(mask)
+        target = dp[mask] - (sums[mask] == 0)
+        rest = mask
+        while rest:
+            low = rest & -rest
+            if dp[mask ^ low] == target:
+                break
+            rest ^= low
+        mask ^= low
+    zero_masks.append(0)
+
+    groups = []
+    for outer, inner in zip(zero_masks, zero_masks[1:]):
+        diff = outer ^ inner
+        groups.append([entries[i] for i in range(n) if diff >> i & 1])
+    return groups
+
+
+def _heuristic_partition(entries, deadline):
+    """Peel off zero-sum pairs, then triples while time allows.
+
+    Whatever is left when the budget runs out forms one final group.
+    """
+    remaining = dict(entries)
+    groups = []
+
+    by_amount = {}
+    for user_id, balance in entries:
+        by_amount.setdefault(balance, []).append(user_id)
+
+    def take(user_id):
+        balance = remaining.pop(user_id)
+        by_amount[balance].remove(user_id)
+        return (user_id, balance)
+
+    for user_id, balance in entries:
+        if balance <= 0 or user_id not in remaining:
+            continue
+        matches = by_amount.get(-balance)
+        if matches:
+            groups.append([take(user_id), take(matches[0])])
+
+    progress = True
+    while progress and time.monotonic() < deadline:
+        progress = False
+        ids = list(remaining)
+        for a_pos, a in enumerate(ids):
+            if time.monotonic() >= deadline:
+                break
+            if a not in remaining:
+                continue
+            for b in ids[a_pos + 1:]:
+                if b not in remaining:
+                    continue
+                candidates = [
+                    c for c in by_amount.get(-(remaining[a] + remaining[b]), ())
+                    if c != a and c != b
+                ]
+                if candidates:
+                    groups.append([take(a), take(b), take(candidates[0])])
+                    progress = True
+                    break
+
+    if remaining:
+        groups.append(list(remaining.items()))
+    return groups
+
+
+def optimal_transfers(balances, time_budget=DEFAULT_TIME_BUDGET):
+    """Minimum-transfer settlement by partitioning members into zero-sum subsets.
+
+    A subset of k members that sums to zero settles in k - 1 transfers, so
+    the fewest transfers come from the most subsets. Small groups are
+    searched exactly; larger ones use a heuristic bounded by time_budget.
+    """
+    entries = sorted((uid, bal) for uid, bal in balances.items() if bal != 0)
+    if sum(bal for _, bal in entries) != 0:
+        return greedy_transfers(balances)
+
+    if len(entries) <= EXACT_MAX_MEMBERS:
+        groups = _exact_partition(entries)
+    else:
+        groups = _heuristic_partition(entries, time.monotonic() + time_budget)
+
+    transfers = []
+    for group in groups:
+        transfers.extend(greedy_transfers(dict(group)))
+    return transfers
+
+
+SOLVERS = {
+    "greedy": greedy_transfers,
+    "optimal": optimal_transfers,
+}
+
+
+def solve_transfers(balances, solver="optimal"):
+    """Memoized settlement plan for a balance vector using a named solver."""
+    key = (solver, tuple(sorted(balances.items())))
+    transfers = _solutions.get(key)
+
+    if transfers is None:
+        transfers = tuple(SOLVERS[solver](balances))
+        _solutions.set(key, transfers)
+
+    return transfers
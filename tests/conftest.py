@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.run import configure_database
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    # Scratch database and job files directory; must be set before app.py is imported
+    configure_database()
+    from app import app
+    return app
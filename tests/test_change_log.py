@@ -0,0 +1,54 @@
+"""Sync cursors must not pass a change that committed out of id order."""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def db_session(flask_app):
+    from migrations import upgrade_schema
+    from models import db
+
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        upgrade_schema()
+        yield db.session
+        db.session.rollback()
+
+
+def _add_change(db_session, change_id, age_seconds):
+    from models import Change
+    db_session.add(Change(
+        id=change_id, group_id=1, user_id=1, entity="group", entity_id=change_id, op="delete",
+        created_at=datetime.utcnow() - timedelta(seconds=age_seconds),
+    ))
+    db_session.commit()
+
+
+def test_page_stops_before_younger_lower_id(db_session):
+    from change_log import head_cursor, sync_page
+
+    # Change 1 is still settling; change 2 committed first and has settled
+    _add_change(db_session, 1, age_seconds=0)
+    _add_change(db_session, 2, age_seconds=60)
+
+    changes, cursor, has_more = sync_page(1, 0, limit=10, settle_seconds=30)
+    assert changes == [] and cursor == 0 and not has_more
+    assert head_cursor(settle_seconds=30) == 0
+
+    changes, cursor, _ = sync_page(1, 0, limit=10, settle_seconds=0)
+    assert [c["seq"] for c in changes] == [1, 2] and cursor == 2
+    assert head_cursor(settle_seconds=0) == 2
+
+
+def test_page_returns_settled_prefix(db_session):
+    from change_log import head_cursor, sync_page
+
+    _add_change(db_session, 1, age_seconds=60)
+    _add_change(db_session, 2, age_seconds=0)
+    _add_change(db_session, 3, age_seconds=60)
+
+    changes, cursor, _ = sync_page(1, 0, limit=10, settle_seconds=30)
+    assert [c["seq"] for c in changes] == [1] and cursor == 1
+    assert head_cursor(settle_seconds=30) == 1
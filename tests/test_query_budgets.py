@@ -0,0 +1,89 @@
+"""Pin the SQL query count of every route in app.py at two data sizes.
+
+Each size gets a fresh scratch database filled by benchmarks.generate and
+one scripted session over every route (benchmarks.query_budgets). A route
+fails if it exceeds its budget or if its query count differs between the
+sizes: a count that grows with data is an N+1 loop. Every route in
+app.url_map needs a budget.
+"""
+import pytest
+
+SIZES = (50, 5000)
+
+# (endpoint, method) -> maximum statements, including the session user lookup
+BUDGETS = {
+    # Both create a member set for their even split (savepoint + 2 inserts); reusing one costs 4 fewer
+    ("add_expense", "POST"): 10,
+    ("add_expense_form", "POST"): 10,
+    ("add_members", "GET"): 5,
+    ("add_members", "POST"): 10,
+    ("add_settlement", "POST"): 4,
+    ("add_settlement_form", "POST"): 4,
+    ("all_users", "GET"): 1,
+    ("balances", "GET"): 2,
+    ("create_group", "POST"): 10,
+    ("create_user", "GET"): 1,
+    ("create_user", "POST"): 3,
+    ("dashboard", "GET"): 3,
+    ("delete_group", "POST"): 5,
+    ("download_job_file", "GET"): 1,
+    ("export_group", "GET"): 5,
+    # group_members, list_expenses and list_settlements read the group's ETag version first;
+    # a 304 costs only that query
+    ("group_members", "GET"): 2,
+    ("group_events_feed", "GET"): 1,
+    ("group_page", "GET"): 7,
+    ("import_group_expenses", "POST"): 20,
+    ("index", "GET"): 0,
+    ("job_status", "GET"): 1,
+    ("list_expenses", "GET"): 3,
+    ("list_jobs", "GET"): 1,
+    ("list_settlements", "GET"): 2,
+    ("login", "POST"): 1,
+    ("login_page", "GET"): 1,
+    ("login_page", "POST"): 1,
+    ("logout", "GET"): 0,
+    ("metrics", "GET"): 0,
+    ("new_group", "GET"): 2,
+    ("new_group", "POST"): 9,
+    ("rebuild_group_balances", "POST"): 3,
+    ("register", "POST"): 3,
+    ("register_page", "GET"): 1,
+    ("register_page", "POST"): 2,
+    ("sync", "GET"): 7,
+    ("user_groups", "GET"): 1,
+    ("user_summary", "GET"): 1,
+}
+
+
+@pytest.fixture(scope="module")
+def counts(flask_app):
+    from benchmarks.query_budgets import measure_routes
+    return {size: measure_routes(flask_app, size) for size in SIZES}
+
+
+@pytest.mark.parametrize("endpoint,method", sorted(BUDGETS))
+def test_route_within_budget(counts, endpoint, method):
+    measured = [counts[size].get((endpoint, method)) for size in SIZES]
+    assert None not in measured, f"{method} {endpoint} has a budget but was not exercised"
+    assert max(measured) <= BUDGETS[(endpoint, method)], f"{method} {endpoint} ran {measured} queries"
+
+
+@pytest.mark.parametrize("endpoint,method", sorted(BUDGETS))
+def test_query_count_does_not_grow_with_data(counts, endpoint, method):
+    small, large = (counts[size].get((endpoint, method)) for size in SIZES)
+    assert small == large, f"{method} {endpoint}: {small} queries at {SIZES[0]} expenses, {large} at {SIZES[1]}"
+
+
+def test_every_exercised_route_has_a_budget(counts):
+    exercised = set().union(*counts.values())
+    assert sorted(exercised - set(BUDGETS)) == []
+
+
+def test_every_route_is_exercised(flask_app, counts):
+    exercised = {endpoint for endpoint, _ in set().union(*counts.values())}
+    uncovered = [
+        f"{rule.rule} ({rule.endpoint})" for rule in flask_app.url_map.iter_rules()
+        if rule.endpoint != "static" and rule.endpoint not in exercised
+    ]
+    assert uncovered == []